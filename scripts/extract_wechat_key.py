@@ -17,17 +17,25 @@ Usage:
   1. Disable SIP: Recovery Mode → csrutil disable → reboot
   2. Quit WeChat
   3. python3 scripts/extract_wechat_key.py
-  4. Log in to WeChat when it opens
+  4. Start WeChat when prompted and log in (LLDB attaches on launch)
   5. Key will be captured and saved to ~/.wechat_db_key
   6. Re-enable SIP: Recovery Mode → csrutil enable → reboot
   7. Extract chats: PYTHONPATH=src python3 -m knowledge_harvester extract-wechat --key-file ~/.wechat_db_key
 """
 
 import os
+import plistlib
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 KEY_OUTPUT = os.path.expanduser("~/.wechat_db_key")
 LOG_OUTPUT = os.path.expanduser("~/.wechat_pbkdf_calls.log")
@@ -56,27 +64,34 @@ def pbkdf_handler(frame, bp_loc, dict):
     global call_count
     call_count += 1
 
-    process = frame.GetThread().GetProcess()
-    x2 = frame.FindRegister("x2").GetValueAsUnsigned()  # passwordLen
+    # Check rounds first: almost every call is rejected after one register read
     x6 = frame.FindRegister("x6").GetValueAsUnsigned()  # rounds
-
-    # Only capture the first 256K-round call (SQLCipher master key derivation)
-    if x6 != 256000 or x2 != 32:
+    if x6 != 256000:
+        return False
+    x2 = frame.FindRegister("x2").GetValueAsUnsigned()  # passwordLen
+    if x2 != 32:
         return False
 
     x1 = frame.FindRegister("x1").GetValueAsUnsigned()  # password ptr
 
+    process = frame.GetThread().GetProcess()
     error = lldb.SBError()
     pw_bytes = process.ReadMemory(x1, 32, error)
     if not error.Success() or not pw_bytes:
         return False
 
     pw_hex = pw_bytes.hex()
-    print(f"\\n*** WECHAT MASTER PASSWORD CAPTURED (call #{call_count}, rounds={x6}) ***")
+    print(f"\\n*** WECHAT MASTER PASSWORD CAPTURED (call #{{call_count}}, rounds={{x6}}) ***")
     print(f"*** KEY: {{pw_hex}} ***\\n")
 
-    with open(KEY_OUTPUT, "w") as kf:
-        kf.write(pw_hex + "\\n")
+    # Atomic write: owner-only temp file, then rename over the key file
+    tmp_path = KEY_OUTPUT + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, (pw_hex + "\\n").encode())
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, KEY_OUTPUT)
     with open(OUTPUT, "a") as lf:
         lf.write(f"Call #{{call_count}}: rounds={{x6}}, pwLen={{x2}}, password_hex={{pw_hex}}\\n")
 
@@ -113,6 +128,59 @@ def _write_debug_entitlements(tmpdir: str) -> str:
     return plist
 
 
+def _codesign_batch(paths: list, entitlements: str):
+    """Ad-hoc sign several binaries with the same entitlements in one codesign call.
+
+    Paths are ordered deepest-first so nested code (frameworks, dylibs) is
+    signed before the bundle binary that contains it.
+    """
+    if not paths:
+        return
+    ordered = sorted(paths, key=lambda p: p.count(os.sep), reverse=True)
+    subprocess.run([
+        "codesign", "--force", "-s", "-",
+        "--entitlements", entitlements, *ordered
+    ], check=True)
+
+
+def _has_debug_entitlement(binary: str) -> bool:
+    """Whether the binary is already signed with get-task-allow (attachable)."""
+    r = subprocess.run(
+        ["codesign", "-d", "--entitlements", "-", "--xml", binary],
+        capture_output=True,
+    )
+    # Older codesign versions prefix the plist with a blob header; parse from
+    # the XML declaration so <false/> is not mistaken for the entitlement.
+    start = r.stdout.find(b"<?xml")
+    if start < 0:
+        return False
+    try:
+        entitlements = plistlib.loads(r.stdout[start:])
+    except Exception:
+        return False
+    return (isinstance(entitlements, dict)
+            and entitlements.get("com.apple.security.get-task-allow") is True)
+
+
+def _stop_running_wechat():
+    """Terminate a running WeChat, in-process via psutil when available."""
+    if psutil is not None:
+        running = [p for p in psutil.process_iter(["name"]) if p.info["name"] == "WeChat"]
+        if not running:
+            return
+        print("Killing running WeChat...")
+        for p in running:
+            p.terminate()
+        psutil.wait_procs(running, timeout=2)
+        return
+
+    r = subprocess.run(["pgrep", "-x", "WeChat"], capture_output=True, text=True)
+    if r.returncode == 0:
+        print("Killing running WeChat...")
+        subprocess.run(["pkill", "-x", "WeChat"])
+        time.sleep(2)
+
+
 def main():
     # Check SIP
     r = subprocess.run(["csrutil", "status"], capture_output=True, text=True)
@@ -127,42 +195,44 @@ def main():
         sys.exit(1)
 
     # Check if WeChat is running
-    r = subprocess.run(["pgrep", "-x", "WeChat"], capture_output=True, text=True)
-    if r.returncode == 0:
-        print("Killing running WeChat...")
-        subprocess.run(["pkill", "-x", "WeChat"])
-        import time; time.sleep(2)
+    _stop_running_wechat()
 
     tmpdir = tempfile.mkdtemp(prefix="wechat_key_")
 
-    # Backup and re-sign WeChat binary with debug entitlements
-    print("Re-signing WeChat with debug entitlements...")
-    if not os.path.exists(WECHAT_BACKUP):
-        subprocess.run(["cp", WECHAT_BIN, WECHAT_BACKUP], check=True)
-    plist = _write_debug_entitlements(tmpdir)
-    subprocess.run([
-        "codesign", "--force", "-s", "-",
-        "--entitlements", plist, WECHAT_BIN
-    ], check=True)
-
-    # Write LLDB Python handler and command file
+    # Backup and re-sign WeChat binary with debug entitlements (only once:
+    # later runs reuse the already re-signed binary)
+    if _has_debug_entitlement(WECHAT_BIN):
+        print("WeChat already has debug entitlements, skipping re-sign.")
+    else:
+        print("Re-signing WeChat with debug entitlements...")
+        if not os.path.exists(WECHAT_BACKUP):
+            shutil.copy2(WECHAT_BIN, WECHAT_BACKUP)
+        plist = _write_debug_entitlements(tmpdir)
+        _codesign_batch([WECHAT_BIN], plist)
+
+    # Write LLDB Python handler and command file.
+    # LLDB waits for the next WeChat launch and attaches to it, so the user
+    # starts WeChat normally instead of LLDB spawning it.
+    # The breakpoint condition filters on rounds/passwordLen inside LLDB, so
+    # the Python handler only runs for the SQLCipher key-derivation call.
     py_script = _write_lldb_python(tmpdir)
     module_name = os.path.splitext(os.path.basename(py_script))[0]
     lldb_file = os.path.join(tmpdir, "extract.lldb")
     with open(lldb_file, "w") as f:
         f.write(f'''\
-target create "{WECHAT_BIN}"
 command script import {py_script}
+process attach --name WeChat --waitfor
 breakpoint set -n CCKeyDerivationPBKDF
+breakpoint modify 1 --condition '$x6 == 256000 && $x2 == 32'
 breakpoint command add -F {module_name}.pbkdf_handler 1
 breakpoint modify 1 --auto-continue true
-run
+continue
 ''')
 
     print()
     print("=" * 60)
-    print("Launching WeChat under LLDB...")
-    print("LOG IN to WeChat when it opens.")
+    print("Waiting for WeChat to launch...")
+    print("START WeChat now and LOG IN.")
     print("The master password will be captured automatically.")
     print("=" * 60)
     print()
@@ -11,15 +11,28 @@
       - message 有 author.role, content.parts, create_time 等
 """
 
-import json
-import zipfile
-from datetime import datetime, timezone
-from pathlib import Path
-from typing import Iterator, List
+import functools
+import itertools
+import math
+import os
+from typing import IO, Iterator, List
+
+try:
+    import ijson as _ijson
+except ImportError:
+    _ijson = None
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
 
 from .base import BaseAdapter
 from ..models import Conversation, MediaRef, Message
 
+# 超过此大小的 conversations.json 才流式解析; 小文件整体解码更快
+STREAM_THRESHOLD_BYTES = 64 * 1024 * 1024
+
 
 class ChatGPTAdapter(BaseAdapter):
     """解析 ChatGPT 官方导出的 conversations.json"""
@@ -34,40 +47,50 @@ class ChatGPTAdapter(BaseAdapter):
         Args:
             source: ZIP 文件路径或 conversations.json 路径
         """
-        path = Path(source)
+        # 仅按扩展名分派, 直接比较字符串, 无需构造 Path
+        path = os.fspath(source)
 
-        if path.suffix == ".zip":
+        if path.endswith(".zip"):
             conversations_data = self._read_from_zip(path)
-        elif path.suffix == ".json":
-            with open(path, "r", encoding="utf-8") as f:
-                conversations_data = json.load(f)
+        elif path.endswith(".json"):
+            conversations_data = self._read_from_json(path)
         else:
-            raise ValueError(f"不支持的文件格式: {path.suffix} (需要 .zip 或 .json)")
-
-        if not isinstance(conversations_data, list):
-            raise ValueError("conversations.json 应该是一个数组")
+            suffix = os.path.splitext(path)[1]
+            raise ValueError(f"不支持的文件格式: {suffix} (需要 .zip 或 .json)")
 
         for conv_data in conversations_data:
             conv = self._parse_conversation(conv_data)
             if conv and conv.messages:
                 yield conv
 
-    def _read_from_zip(self, zip_path: Path) -> list:
-        """从 ZIP 文件中读取 conversations.json"""
+    def _read_from_json(self, json_path: str) -> Iterator[dict]:
+        """逐个读取 conversations.json 中的对话"""
+        size = os.path.getsize(json_path)
+        with open(json_path, "rb") as f:
+            yield from _iter_json_array(f, size)
+
+    def _read_from_zip(self, zip_path: str) -> Iterator[dict]:
+        """从 ZIP 文件中逐个读取 conversations.json 的对话
+
+        ZIP 句柄在迭代期间保持打开, 迭代结束后关闭。
+        """
+        import zipfile
+
         with zipfile.ZipFile(zip_path, "r") as zf:
-            names = zf.namelist()
-            # 查找 conversations.json (可能在子目录)
-            conv_file = None
-            for name in names:
-                if name.endswith("conversations.json"):
-                    conv_file = name
-                    break
-
-            if conv_file is None:
+            # 先按根目录直接查找 (字典查找), 再在子目录中查找
+            try:
+                info = zf.getinfo("conversations.json")
+            except KeyError:
+                info = next(
+                    (i for i in zf.infolist() if i.filename.endswith("conversations.json")),
+                    None,
+                )
+
+            if info is None:
                 raise FileNotFoundError("ZIP 中未找到 conversations.json")
 
-            with zf.open(conv_file) as f:
-                return json.load(f)
+            with zf.open(info) as f:
+                yield from _iter_json_array(f, info.file_size)
 
     def _parse_conversation(self, data: dict) -> Conversation:
         """解析单段对话"""
@@ -77,7 +100,7 @@ class ChatGPTAdapter(BaseAdapter):
         mapping = data.get("mapping", {})
 
         # 从 mapping 树中提取有序消息
-        messages = self._extract_messages(mapping)
+        messages = self._extract_messages(mapping, data.get("current_node"))
 
         # 元数据
         metadata = {}
@@ -99,121 +122,128 @@ class ChatGPTAdapter(BaseAdapter):
             metadata=metadata,
         )
 
-    def _extract_messages(self, mapping: dict) -> List[Message]:
+    def _extract_messages(self, mapping: dict,
+                          current_node: str = None) -> List[Message]:
         """从 mapping 树中按顺序提取消息
 
         ChatGPT mapping 是一棵树:
-          - 找到根节点 (没有 parent 或 parent 不在 mapping 中)
-          - 沿 children 遍历主线 (取每个节点的第一个 child)
+          - 有 current_node (当前分支的叶子) 时, 沿 parent 向上回溯再反转,
+            复杂度 O(深度)
+          - 否则找到根节点 (不是任何节点的 child), 沿 children 遍历主线
+            (取每个节点的第一个 child)
         """
         if not mapping:
             return []
 
-        # 找根节点
-        root_id = None
-        for node_id, node in mapping.items():
-            parent = node.get("parent")
-            if parent is None or parent not in mapping:
-                root_id = node_id
-                break
-
-        if root_id is None:
-            return []
+        if current_node in mapping:
+            nodes = self._walk_up(mapping, current_node)
+        else:
+            nodes = self._walk_down(mapping)
 
-        # 沿主线遍历, 提取消息
+        parse = self._parse_node_message
         messages = []
-        current_id = root_id
-        visited = set()
-
-        while current_id and current_id not in visited:
-            visited.add(current_id)
-            node = mapping.get(current_id)
-            if node is None:
-                break
-
-            msg = self._parse_node_message(node)
+        for node in nodes:
+            msg = parse(node)
             if msg is not None:
                 messages.append(msg)
 
-            # 取第一个 child 继续
-            children = node.get("children", [])
-            current_id = children[0] if children else None
-
         return messages
 
+    @staticmethod
+    def _walk_up(mapping: dict, leaf_id: str) -> List[dict]:
+        """从叶子沿 parent 回溯到根, 返回根 → 叶子的节点列表"""
+        get = mapping.get
+        nodes = []
+        node = get(leaf_id)
+        # 步数上限防止环状数据导致死循环
+        for _ in range(len(mapping)):
+            if node is None:
+                break
+            nodes.append(node)
+            node = get(node.get("parent"))
+        nodes.reverse()
+        return nodes
+
+    @staticmethod
+    def _walk_down(mapping: dict) -> List[dict]:
+        """从根节点沿第一个 child 遍历主线, 返回节点列表"""
+        child_ids = set()
+        for node in mapping.values():
+            child_ids.update(node.get("children") or ())
+        root_id = next((nid for nid in mapping if nid not in child_ids), None)
+
+        get = mapping.get
+        nodes = []
+        node = get(root_id)
+        for _ in range(len(mapping)):
+            if node is None:
+                break
+            nodes.append(node)
+            children = node.get("children")
+            node = get(children[0]) if children else None
+        return nodes
+
     def _parse_node_message(self, node: dict) -> Message:
         """解析节点中的消息, 返回 None 如果不是有效消息"""
         msg_data = node.get("message")
         if msg_data is None:
             return None
-
-        author = msg_data.get("author", {})
-        role = author.get("role", "")
-
-        # 跳过 system 消息 (通常是空的初始消息)
-        if role == "system":
-            content = self._extract_content(msg_data)
-            if not content.strip():
-                return None
+        get = msg_data.get
 
         # 跳过未完成的消息
-        status = msg_data.get("status")
+        status = get("status")
         if status and status not in ("finished_successfully", "finished_partial_completion"):
             return None
 
+        role = (get("author") or {}).get("role", "")
         content, media = self._extract_content_and_media(msg_data)
+
+        # 跳过 system 消息 (通常是空的初始消息)
+        if role == "system" and not content.strip():
+            return None
         if not content and not media:
             return None
 
         # 时间戳
-        create_time = msg_data.get("create_time")
+        create_time = get("create_time")
         timestamp = _timestamp_to_iso(create_time) if create_time else ""
 
-        # 消息 ID
-        message_id = msg_data.get("id", "")
-
         # 标准化 role
         if role == "tool":
             role = "system"
 
         # 内容类型
         content_type = "text"
-        if media and not content:
-            content_type = media[0].type  # "image" or "voice"
-        elif media and content:
-            content_type = "mixed"
+        if media:
+            content_type = "mixed" if content else media[0].type  # "image" or "voice"
 
         return Message(
             role=role,
             content=content,
             timestamp=timestamp,
-            message_id=message_id,
+            message_id=get("id", ""),
             content_type=content_type,
             media=media,
         )
 
-    def _extract_content(self, msg_data: dict) -> str:
-        """提取纯文本内容"""
-        content_obj = msg_data.get("content", {})
-        parts = content_obj.get("parts", [])
-        text_parts = []
-        for part in parts:
-            if isinstance(part, str):
-                text_parts.append(part)
-        return "\n".join(text_parts)
-
     def _extract_content_and_media(self, msg_data: dict) -> tuple:
-        """提取文本内容和媒体引用"""
-        content_obj = msg_data.get("content", {})
-        parts = content_obj.get("parts", [])
+        """提取文本内容和媒体引用 (单次遍历 content.parts)"""
+        parts = (msg_data.get("content") or {}).get("parts") or ()
+
+        # 快速路径: 绝大多数消息只有一段纯文本
+        if len(parts) == 1 and type(parts[0]) is str:
+            return parts[0], []
+        # 纯文本多段 (流式回复): 直接 join 原列表, 不逐段复制
+        if all(type(part) is str for part in parts):
+            return "\n".join(parts), []
 
         text_parts = []
         media_refs = []
 
         for part in parts:
-            if isinstance(part, str):
+            if type(part) is str:
                 text_parts.append(part)
-            elif isinstance(part, dict):
+            elif type(part) is dict:
                 content_type = part.get("content_type", "")
                 if content_type == "image_asset_pointer":
                     asset = part.get("asset_pointer", "")
@@ -233,12 +263,63 @@ class ChatGPTAdapter(BaseAdapter):
         return "\n".join(text_parts), media_refs
 
 
+def _iter_json_array(f: IO[bytes], size: int = 0) -> Iterator[dict]:
+    """逐个产出顶层 JSON 数组的元素
+
+    大文件 (>= STREAM_THRESHOLD_BYTES) 且安装了 ijson 时流式解析,
+    内存中只保留当前一段对话; 否则整体解码 (优先 orjson, 回退 json)。
+    """
+    if _ijson is not None and size >= STREAM_THRESHOLD_BYTES:
+        events = _ijson.parse(f, use_float=True)
+        first = next(events, None)
+        if first is None or first[1] != "start_array":
+            raise ValueError("conversations.json 应该是一个数组")
+        yield from _ijson.items(itertools.chain((first,), events), "item")
+        return
+
+    if _orjson is not None:
+        data = _orjson.loads(f.read())
+    else:
+        import json
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("conversations.json 应该是一个数组")
+    yield from data
+
+
+@functools.lru_cache(maxsize=8192)
+def _iso_prefix(seconds: int) -> str:
+    """整秒 Unix timestamp → "YYYY-MM-DDTHH:MM:SS" (UTC), 结果缓存
+
+    create_time 带小数部分, 几乎每条消息都不同; 按整秒缓存, 同一段对话中
+    相邻消息的日期时间部分才能命中。
+    """
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _iso_from_seconds(seconds: float) -> str:
+    """Unix timestamp (float) → ISO 8601, 与 datetime.fromtimestamp(...).isoformat() 相同"""
+    # 微秒的取整方式与 datetime.fromtimestamp 一致 (四舍六入五成双)
+    frac, whole = math.modf(seconds)
+    us = round(frac * 1e6)
+    if us >= 1000000:
+        whole += 1
+        us -= 1000000
+    elif us < 0:
+        whole -= 1
+        us += 1000000
+    prefix = _iso_prefix(int(whole))
+    if us:
+        return f"{prefix}.{us:06d}+00:00"
+    return prefix + "+00:00"
+
+
 def _timestamp_to_iso(ts) -> str:
     """Unix timestamp → ISO 8601 字符串"""
     if ts is None:
         return ""
     try:
-        dt = datetime.fromtimestamp(float(ts), tz=timezone.utc)
-        return dt.isoformat()
+        return _iso_from_seconds(float(ts))
     except (ValueError, TypeError, OSError):
         return ""
@@ -15,10 +15,10 @@
   4. python3 -m knowledge_harvester scrape-doubao
 """
 
-import json
-import re
-import time
-from typing import Iterator, List, Optional
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
 
 from .base import BaseAdapter
 from ..browser_client import BrowserClient, BrowserError
@@ -35,6 +35,123 @@ DOUBAO_EXPECTED_SELECTORS = {
 }
 
 
+# 侧边栏对话列表提取脚本
+_GET_CONVERSATION_LIST_JS = """() => {
+    const conversations = [];
+
+    // 豆包侧边栏的对话链接
+    const selectors = [
+        'a[href*="/chat/"]',
+        '[data-testid*="conversation"]',
+        '[class*="session-item"]',
+        '[class*="SessionItem"]',
+        '[class*="chat-item"]',
+        '[class*="conversation"]',
+    ];
+
+    let links = [];
+    for (const sel of selectors) {
+        links = document.querySelectorAll(sel);
+        if (links.length > 0) break;
+    }
+
+    links.forEach(el => {
+        const link = el.tagName === 'A' ? el : el.querySelector('a') || el.closest('a');
+        const href = link?.href || '';
+        const title = el.textContent.trim().slice(0, 100);
+
+        // 从 URL 提取对话 ID
+        const idMatch = href.match(/\\/chat\\/([^/?]+)/);
+        const id = idMatch?.[1] || el.getAttribute('data-id') ||
+                   el.getAttribute('data-session-id') || '';
+
+        if (id || title) {
+            conversations.push({ id, title, href });
+        }
+    });
+
+    return conversations;
+}"""
+
+# 消息提取脚本: 返回列式 JSON {roles, contents, timestamps}
+_EXTRACT_MESSAGES_JS = """() => {
+    const roles = [], contents = [], timestamps = [];
+    const MAX_CHARS = 50000;
+    const USER_RE = /user|human|question/i;
+    const BOT_RE = /assistant|bot|answer|response/i;
+
+    // 按文本节点累积, 超过上限即停止 (不遍历超长回复的剩余子树)
+    const collectText = (el) => {
+        const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+        let text = '';
+        while (walker.nextNode()) {
+            text += walker.currentNode.data;
+            if (text.length > MAX_CHARS) break;
+        }
+        return text.trim();
+    };
+
+    // 豆包的消息容器选择器 (可能随版本变化), 按优先级排列
+    const selectors = [
+        '[data-testid*="message"]',
+        '[class*="message-item"]',
+        '[class*="MessageItem"]',
+        '[class*="chat-message"]',
+        '[class*="turn-"]',
+        '[role="article"]',
+    ];
+
+    // 一次 querySelectorAll 取所有候选, 再按优先级挑出第一组命中的选择器
+    const candidates = document.querySelectorAll(selectors.join(', '));
+    let elements = [];
+    for (const sel of selectors) {
+        elements = Array.prototype.filter.call(candidates, el => el.matches(sel));
+        if (elements.length > 0) break;
+    }
+
+    // 备选: 查找主聊天区域的消息块
+    if (elements.length === 0) {
+        const chatArea = document.querySelector('[class*="chat-content"]') ||
+                         document.querySelector('[class*="ChatContent"]') ||
+                         document.querySelector('main');
+        if (chatArea) {
+            elements = chatArea.querySelectorAll(':scope > div');
+        }
+    }
+
+    elements.forEach((el, idx) => {
+        const text = collectText(el);
+        if (text.length < 2) return;
+
+        // 推断角色
+        let role;
+        const cls = typeof el.className === 'string' ? el.className : '';
+        const dataRole = el.getAttribute('data-role') ||
+                         el.getAttribute('data-message-role') || '';
+
+        if (dataRole) {
+            role = dataRole.includes('user') || dataRole.includes('human') ? 'user' :
+                   dataRole.includes('assistant') || dataRole.includes('bot') ? 'assistant' : dataRole;
+        } else if (USER_RE.test(cls)) {
+            role = 'user';
+        } else if (BOT_RE.test(cls)) {
+            role = 'assistant';
+        } else {
+            role = idx % 2 === 0 ? 'user' : 'assistant';
+        }
+
+        // 时间戳
+        const timeEl = el.querySelector('time') || el.querySelector('[class*="time"]');
+
+        roles.push(role);
+        contents.push(text.slice(0, MAX_CHARS).trimEnd());
+        timestamps.push(timeEl?.getAttribute('datetime') || '');
+    });
+
+    return { roles, contents, timestamps };
+}"""
+
+
 class DoubaoAdapter(BaseAdapter):
     """通过浏览器自动化提取豆包对话"""
 
@@ -111,16 +228,34 @@ class DoubaoAdapter(BaseAdapter):
             conversation_ids = self._get_conversation_list(target_id)
             print(f"  发现 {len(conversation_ids)} 段豆包对话")
 
-            for i, conv_meta in enumerate(conversation_ids):
-                try:
-                    conv = self._extract_conversation(target_id, conv_meta, i + 1)
+            # 流水线: 当前对话交给下游 (保存等) 处理时, 后台线程已开始
+            # 反爬延迟并加载下一段对话 (此时当前页面已读取完毕)。
+            # 调用方提前停止时通知后台线程在下一步前放弃, 不等待它完成
+            stop = threading.Event()
+            loader = ThreadPoolExecutor(max_workers=1)
+            try:
+                pending = None
+                if conversation_ids:
+                    pending = loader.submit(
+                        self._open_conversation, target_id, conversation_ids[0], 1, stop)
+
+                for i, conv_meta in enumerate(conversation_ids):
+                    conv = None
+                    try:
+                        if pending.result():
+                            conv = self._read_conversation(target_id, conv_meta, i + 1)
+                    except Exception as e:
+                        print(f"  ✗ 提取对话失败: {conv_meta.get('title', '?')}: {e}")
+
+                    if i + 1 < len(conversation_ids):
+                        pending = loader.submit(
+                            self._delay_then_open, target_id, conversation_ids[i + 1], i + 2, stop)
+
                     if conv and conv.messages:
                         yield conv
-                except Exception as e:
-                    print(f"  ✗ 提取对话失败: {conv_meta.get('title', '?')}: {e}")
-
-                # 豆包需要更长延迟以避免触发反爬
-                browser.human_delay(3.0, 7.0)
+            finally:
+                stop.set()
+                loader.shutdown(wait=False, cancel_futures=True)
 
         finally:
             try:
@@ -132,78 +267,63 @@ class DoubaoAdapter(BaseAdapter):
         """从侧边栏提取对话列表"""
         browser = self._browser
 
-        result = browser.evaluate("""() => {
-            const conversations = [];
-
-            // 豆包侧边栏的对话链接
-            const selectors = [
-                'a[href*="/chat/"]',
-                '[data-testid*="conversation"]',
-                '[class*="session-item"]',
-                '[class*="SessionItem"]',
-                '[class*="chat-item"]',
-                '[class*="conversation"]',
-            ];
-
-            let links = [];
-            for (const sel of selectors) {
-                links = document.querySelectorAll(sel);
-                if (links.length > 0) break;
-            }
-
-            links.forEach(el => {
-                const link = el.tagName === 'A' ? el : el.querySelector('a') || el.closest('a');
-                const href = link?.href || '';
-                const title = el.textContent.trim().slice(0, 100);
-
-                // 从 URL 提取对话 ID
-                const idMatch = href.match(/\\/chat\\/([^/?]+)/);
-                const id = idMatch?.[1] || el.getAttribute('data-id') ||
-                           el.getAttribute('data-session-id') || '';
-
-                if (id || title) {
-                    conversations.push({ id, title, href });
-                }
-            });
-
-            return conversations;
-        }""", target_id)
+        result = browser.evaluate(_GET_CONVERSATION_LIST_JS, target_id)
 
         items = result.get("result", [])
 
-        # 去重
-        seen = set()
-        unique = []
+        # 去重 (按 id, 无 id 时按标题; 保留首次出现的顺序)
+        unique = {}
         for item in items:
             key = item.get("id") or item.get("title", "")
-            if key and key not in seen:
-                seen.add(key)
-                unique.append(item)
+            if key:
+                unique.setdefault(key, item)
 
-        return unique
+        return list(unique.values())
 
-    def _extract_conversation(self, target_id: str, conv_meta: dict,
-                              index: int) -> Optional[Conversation]:
-        """提取单段对话的消息"""
+    def _delay_then_open(self, target_id: str, conv_meta: dict, index: int,
+                         stop: threading.Event) -> bool:
+        """反爬延迟后打开下一段对话 (在后台线程中与下游处理重叠)"""
+        # 豆包需要更长延迟以避免触发反爬
+        if _pause(stop, 3.0, 7.0):
+            return False
+        return self._open_conversation(target_id, conv_meta, index, stop)
+
+    def _open_conversation(self, target_id: str, conv_meta: dict, index: int,
+                           stop: threading.Event) -> bool:
+        """导航到对话并等待加载完成, 返回 False 如果无法定位对话或已被停止
+
+        每一步之前检查 stop: 提取已结束时不再操作标签页。
+        """
         browser = self._browser
         conv_id = conv_meta.get("id", f"doubao-{index}")
-        title = conv_meta.get("title", "")
         href = conv_meta.get("href", "")
 
+        if stop.is_set():
+            return False
         # 导航到对话
         if href:
             browser.navigate(href, target_id)
         elif conv_id:
             browser.navigate(f"{DOUBAO_URL}/chat/{conv_id}", target_id)
         else:
-            return None
+            return False
 
+        if stop.is_set():
+            return False
         browser.wait(target_id, load_state="networkidle", timeout_ms=20000)
-        browser.human_delay(2.0, 4.0)
+        if _pause(stop, 2.0, 4.0):
+            return False
 
         # 滚动到顶部加载历史消息
         browser.scroll_to_top(target_id)
-        browser.human_delay(1.0, 2.0)
+        return not _pause(stop, 1.0, 2.0)
+
+    def _read_conversation(self, target_id: str, conv_meta: dict,
+                           index: int) -> Conversation:
+        """从已加载的对话页面读取消息"""
+        conv_id = conv_meta.get("id", f"doubao-{index}")
+        title = conv_meta.get("title", "")
+        href = conv_meta.get("href", "")
 
         # 提取消息
         messages = self._extract_messages(target_id)
@@ -221,91 +341,26 @@ class DoubaoAdapter(BaseAdapter):
         )
 
     def _extract_messages(self, target_id: str) -> List[Message]:
-        """从当前页面提取所有消息"""
+        """从当前页面提取所有消息
+
+        JS 端完成过滤和角色推断, 以列式 JSON ({roles, contents, timestamps})
+        返回, 减少 CDP 负载和 Python 端的中间 dict。
+        """
         browser = self._browser
 
-        result = browser.evaluate("""() => {
-            const messages = [];
-
-            // 豆包的消息容器选择器 (可能随版本变化)
-            const selectors = [
-                '[data-testid*="message"]',
-                '[class*="message-item"]',
-                '[class*="MessageItem"]',
-                '[class*="chat-message"]',
-                '[class*="turn-"]',
-                '[role="article"]',
-            ];
-
-            let elements = [];
-            for (const sel of selectors) {
-                elements = document.querySelectorAll(sel);
-                if (elements.length > 0) break;
-            }
-
-            // 备选: 查找主聊天区域的消息块
-            if (elements.length === 0) {
-                const chatArea = document.querySelector('[class*="chat-content"]') ||
-                                 document.querySelector('[class*="ChatContent"]') ||
-                                 document.querySelector('main');
-                if (chatArea) {
-                    elements = chatArea.querySelectorAll(':scope > div');
-                }
-            }
-
-            elements.forEach((el, idx) => {
-                const text = el.textContent.trim();
-                if (!text || text.length < 2) return;
-
-                // 推断角色
-                let role = 'unknown';
-                const cls = (el.className || '').toLowerCase();
-                const dataRole = el.getAttribute('data-role') ||
-                                 el.getAttribute('data-message-role') || '';
-
-                if (dataRole) {
-                    role = dataRole.includes('user') || dataRole.includes('human') ? 'user' :
-                           dataRole.includes('assistant') || dataRole.includes('bot') ? 'assistant' : dataRole;
-                } else if (cls.includes('user') || cls.includes('human') || cls.includes('question')) {
-                    role = 'user';
-                } else if (cls.includes('assistant') || cls.includes('bot') ||
-                           cls.includes('answer') || cls.includes('response')) {
-                    role = 'assistant';
-                } else {
-                    role = idx % 2 === 0 ? 'user' : 'assistant';
-                }
-
-                // 时间戳
-                const timeEl = el.querySelector('time') || el.querySelector('[class*="time"]');
-                const timestamp = timeEl?.getAttribute('datetime') || '';
-
-                messages.push({
-                    role: role,
-                    content: text.slice(0, 50000),
-                    timestamp: timestamp,
-                    index: idx
-                });
-            });
-
-            return messages;
-        }""", target_id)
-
-        raw_messages = result.get("result", [])
-
-        messages = []
-        for raw in raw_messages:
-            role = raw.get("role", "unknown")
-            if role == "unknown":
-                continue
-
-            content = raw.get("content", "").strip()
-            if not content:
-                continue
-
-            messages.append(Message(
-                role=role,
-                content=content,
-                timestamp=raw.get("timestamp", ""),
-            ))
-
-        return messages
+        result = browser.evaluate(_EXTRACT_MESSAGES_JS, target_id)
+
+        data = result.get("result") or {}
+
+        return [
+            Message(role=role, content=content, timestamp=timestamp)
+            for role, content, timestamp in zip(
+                data.get("roles", []), data.get("contents", []), data.get("timestamps", []),
+            )
+            if role != "unknown" and content
+        ]
+
+
+def _pause(stop: threading.Event, min_sec: float, max_sec: float) -> bool:
+    """随机延迟 (同 BrowserClient.human_delay), stop 被设置时立即返回; 返回是否已停止"""
+    return stop.wait(random.uniform(min_sec, max_sec))
@@ -10,9 +10,15 @@
   4. python3 -m knowledge_harvester scrape-grok
 """
 
+import functools
 import json
+import logging
+import queue
 import re
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Iterator, List, Optional
 
@@ -20,9 +26,23 @@ from .base import BaseAdapter
 from ..browser_client import BrowserClient, BrowserError
 from ..models import Conversation, Message
 
+log = logging.getLogger(__name__)
+
 
 GROK_URL = "https://grok.com"
 
+# 有效的 ISO 时间戳前缀 (YYYY-), 过滤掉 "2 小时前" 之类的相对时间文本
+_ISO_TIMESTAMP_RE = re.compile(r"20\d{2}-")
+
+# 并行提取使用的标签页数 (瓶颈是页面加载/往返延迟, 不是 CPU)
+TAB_POOL_SIZE = 3
+
+# 对话间延迟 (秒): 初始范围, 连续成功时按 DELAY_DECAY 收缩, 但不低于下限;
+# 失败时恢复初始范围
+DELAY_RANGE = (2.0, 5.0)
+DELAY_FLOOR = (0.5, 1.0)
+DELAY_DECAY = 0.9
+
 # 已知有效的 DOM 选择器 (用于版本检测)
 GROK_EXPECTED_SELECTORS = {
     "sidebar_links": 'a[href*="/chat/"]',
@@ -30,12 +50,221 @@ GROK_EXPECTED_SELECTORS = {
     "main_area": 'main, [role="main"]',
 }
 
+# 消息容器候选选择器, 按优先级排列 (Grok UI 可能更新)
+_MESSAGE_SELECTORS = (
+    '[data-testid*="message"]',
+    '[class*="message-row"]',
+    '[class*="MessageRow"]',
+    '.message',
+    '[role="article"]',
+)
+
+# 预先拼接的并集选择器 (注入 JS 时用 json.dumps 转义)
+_GROK_MSG_SELECTOR = ", ".join(_MESSAGE_SELECTORS)
+_GROK_CONV_SELECTOR = '[data-testid*="conversation"], [class*="conversation"]'
+
+# 页面就绪判断 (JS 表达式, 供 BrowserClient.wait_ready 轮询)
+_HOME_READY_JS = (
+    "document.querySelector('main') && "
+    "document.querySelectorAll('a[href*=\"/chat/\"]').length > 0"
+)
+_MAIN_READY_JS = "!!document.querySelector('main, [role=\"main\"]')"
+_CONVERSATION_READY_JS = f"document.querySelector({json.dumps(_GROK_MSG_SELECTOR)}) !== null"
+
+# 检查关键选择器: 一次 querySelectorAll 取所有候选, 再用 matches 分桶计数
+_CHECK_COMPATIBILITY_JS = """() => {
+    const buckets = {
+        sidebar_links: 'a[href*="/chat/"]',
+        message_area: '[data-testid*="message"], [class*="message-row"], [role="article"]',
+        main: 'main, [role="main"]',
+    };
+    const checks = { sidebar_links: 0, message_area: 0, main: 0 };
+    const all = document.querySelectorAll(Object.values(buckets).join(', '));
+    for (const el of all) {
+        for (const key in buckets) {
+            if (el.matches(buckets[key])) checks[key]++;
+        }
+    }
+    checks.title = document.title;
+    return checks;
+}"""
+
+# 侧边栏对话链接: getElementsByTagName 走标签索引, 比属性子串选择器 a[href*="/chat/"] 快
+_CONVERSATION_LINKS_JS = """() => {
+    const CHAT_PATH_RE = /^\\/chat\\/([^/?]+)/;
+    const links = document.getElementsByTagName('a');
+    const out = [];
+    for (let i = 0; i < links.length; i++) {
+        const a = links[i];
+        const m = a.pathname && CHAT_PATH_RE.exec(a.pathname);
+        if (m) out.push({ href: a.href, title: a.textContent.trim(), id: m[1] });
+    }
+    return out;
+}"""
+
+# 备选对话列表: 按 conversation 类名/testid 查找
+_CONVERSATION_ITEMS_JS = """() => {
+    const CHAT_PATH_RE = /^\\/chat\\/([^/?]+)/;
+    const items = document.querySelectorAll(__CONV_SELECTOR__);
+    const out = [];
+    for (let i = 0, n = items.length; i < n; i++) {
+        const el = items[i];
+        const link = el.querySelector('a') || el.closest('a');
+        const m = link?.pathname && CHAT_PATH_RE.exec(link.pathname);
+        const id = (m && m[1]) || el.getAttribute('data-id') || '';
+        const title = el.textContent.slice(0, 100).trim();
+        if (id || title) out.push({ href: link?.href || '', title, id });
+    }
+    return out;
+}""".replace("__CONV_SELECTOR__", json.dumps(_GROK_CONV_SELECTOR))
+
+
+# 消息提取: 先滚动到顶部并等待 DOM 静默 (懒加载的历史消息), 再提取,
+# 一次 evaluate 完成原来 scroll_to_top + 延迟 + evaluate 三次往返。
+# 按批返回 {batch, next, done}: 首批随本次调用返回, 后续批次通过
+# window.__grokExtract(next) 获取 (_EXTRACT_BATCH_JS), 单次传输大小有上限
+_EXTRACT_MESSAGES_JS_TEMPLATE = """async () => {
+    const BATCH_SIZE = 200;
+    const USER_RE = /user|human/i;
+    const BOT_RE = /assistant|bot|grok/i;
+
+    // 候选选择器 (已知 UI 版本时只有一个)
+    const selectors = __SELECTORS__;
+
+    // 滚动到顶部: 窗口本身 + 消息所在的可滚动容器
+    window.scrollTo(0, 0);
+    let scroller = document.querySelector(__SELECTOR_UNION__);
+    while (scroller && scroller.scrollHeight <= scroller.clientHeight) {
+        scroller = scroller.parentElement;
+    }
+    if (scroller) scroller.scrollTop = 0;
+
+    // 等待 DOM 静默: 无变动 1200ms 或最后一次变动后 400ms, 最多 5s
+    await new Promise(resolve => {
+        let timer;
+        const done = () => { mo.disconnect(); clearTimeout(cap); resolve(); };
+        const mo = new MutationObserver(() => {
+            clearTimeout(timer);
+            timer = setTimeout(done, 400);
+        });
+        const cap = setTimeout(done, 5000);
+        timer = setTimeout(done, 1200);
+        mo.observe(document.body, { childList: true, subtree: true });
+    });
+
+    // 一次 querySelectorAll 取所有候选, 再按优先级挑出第一组命中的选择器
+    // (直接使用并集会混入嵌套匹配, 导致消息重复)
+    const candidates = document.querySelectorAll(__SELECTOR_UNION__);
+    let elements = [];
+    let matched = '';
+    for (const sel of selectors) {
+        elements = Array.prototype.filter.call(candidates, el => el.matches(sel));
+        if (elements.length > 0) {
+            matched = sel;
+            break;
+        }
+    }
+
+    // 备选: 按结构特征查找对话消息
+    if (elements.length === 0) {
+        // Grok 的消息通常在 main 区域内, 交替的 user/assistant 块
+        const main = document.querySelector('main') || document.querySelector('[role="main"]');
+        if (main) {
+            // 查找 turn 容器 — 通常是直接子级 div
+            const turns = main.querySelectorAll(':scope > div > div');
+            elements = turns;
+        }
+    }
+
+    // 时间戳索引: 一次扫描所有 time 元素, 归到最近的消息祖先
+    // (替代每条消息各自 querySelector('time') 的子树扫描; 保留文档顺序中的第一个)
+    const messageSet = new Set(elements);
+    const timeByMessage = new Map();
+    const times = document.getElementsByTagName('time');
+    for (let i = 0; i < times.length; i++) {
+        for (let p = times[i].parentElement; p; p = p.parentElement) {
+            if (messageSet.has(p)) {
+                if (!timeByMessage.has(p)) timeByMessage.set(p, times[i]);
+                break;
+            }
+        }
+    }
+
+    const n = elements.length;
+    const extractBatch = (offset) => {
+        const batch = [];
+        const end = Math.min(n, offset + BATCH_SIZE);
+        for (let idx = offset; idx < end; idx++) {
+            const el = elements[idx];
+            // 推断角色: 检查类名、data 属性、或位置 (偶数=user, 奇数=assistant)
+            let role = 'unknown';
+            const cls = typeof el.className === 'string' ? el.className : '';
+            const dataRole = el.getAttribute('data-role') || el.getAttribute('data-message-author-role') || '';
+
+            if (dataRole) {
+                role = dataRole.includes('user') ? 'user' :
+                       BOT_RE.test(dataRole) ? 'assistant' : dataRole;
+            } else if (USER_RE.test(cls)) {
+                role = 'user';
+            } else if (BOT_RE.test(cls)) {
+                role = 'assistant';
+            } else {
+                // 按位置交替推断
+                role = idx % 2 === 0 ? 'user' : 'assistant';
+            }
+
+            // 角色只依赖属性和位置; 无法识别时不再读取 (可能很大的) 文本
+            if (role === 'unknown') continue;
+
+            // 先截断再 trim, 超长消息不必为首尾空白复制整段文本
+            const raw = el.textContent;
+            const text = (raw.length > 50000 ? raw.slice(0, 50000) : raw).trim();
+            if (!text) continue;
+
+            // 提取时间戳 (如果存在 time 或 datetime 元素)
+            const timeEl = timeByMessage.get(el);
+            const timestamp = timeEl?.getAttribute('datetime') || timeEl?.textContent || '';
+
+            // 短键名 (r=role, c=content, t=timestamp) 减少长对话经 CDP 传输的字节数
+            batch.push({ r: role, c: text, t: timestamp });
+        }
+
+        const done = end >= n;
+        // 取完最后一批后释放元素引用
+        if (done) delete window.__grokExtract;
+        return { batch, next: end, done };
+    };
+
+    window.__grokExtract = extractBatch;
+    // 首批附带命中的选择器 (空串表示都未命中, 用了结构特征备选)
+    const first = extractBatch(0);
+    first.selector = matched;
+    return first;
+}"""
+
+
+@functools.lru_cache(maxsize=8)
+def _extract_messages_js(selectors: tuple = _MESSAGE_SELECTORS) -> str:
+    """生成消息提取脚本, 只探测给定的选择器"""
+    return (_EXTRACT_MESSAGES_JS_TEMPLATE
+            .replace("__SELECTORS__", json.dumps(selectors))
+            .replace("__SELECTOR_UNION__", json.dumps(", ".join(selectors))))
+
+# 获取后续批次 (页面已导航离开时返回空的完成批次)
+_EXTRACT_BATCH_JS = """() => window.__grokExtract
+    ? window.__grokExtract(%d)
+    : { batch: [], next: 0, done: true }"""
+
 
 class GrokAdapter(BaseAdapter):
     """通过浏览器自动化提取 Grok 对话"""
 
     def __init__(self, browser: BrowserClient = None):
         self._browser = browser or BrowserClient()
+        # 首段对话中命中的消息选择器; None 表示按优先级逐个探测
+        self._selector_variant = None
+        self._delay_lo, self._delay_hi = DELAY_RANGE
+        self._delay_lock = threading.Lock()
 
     @property
     def platform(self) -> str:
@@ -49,22 +278,17 @@ class GrokAdapter(BaseAdapter):
 
         warnings = []
         try:
-            tab = browser.open_tab(GROK_URL)
-            target_id = tab.get("targetId", "")
-            browser.wait(target_id, load_state="networkidle", timeout_ms=20000)
-            browser.human_delay(2.0, 3.0)
+            # 优先复用用户已打开的 Grok 标签页, 省去一次完整的页面加载
+            target_id = self._find_grok_tab()
+            opened = not target_id
+            if opened:
+                tab = browser.open_tab(GROK_URL)
+                target_id = tab.get("targetId", "")
+                browser.wait_ready(target_id, _MAIN_READY_JS, timeout_ms=20000)
+                browser.human_delay(2.0, 3.0)
 
             # 检查各关键选择器
-            result = browser.evaluate("""() => {
-                const checks = {};
-                checks.sidebar_links = document.querySelectorAll('a[href*="/chat/"]').length;
-                checks.message_area = document.querySelectorAll(
-                    '[data-testid*="message"], [class*="message-row"], [role="article"]'
-                ).length;
-                checks.main = document.querySelectorAll('main, [role="main"]').length;
-                checks.title = document.title;
-                return checks;
-            }""", target_id)
+            result = browser.evaluate(_CHECK_COMPATIBILITY_JS, target_id)
 
             checks = result.get("result", {})
 
@@ -73,12 +297,24 @@ class GrokAdapter(BaseAdapter):
             if not checks.get("sidebar_links"):
                 warnings.append("未找到侧边栏对话链接 — 可能未登录或 UI 已变化")
 
-            browser.close_tab(target_id)
+            if opened:
+                browser.close_tab(target_id)
         except Exception as e:
             warnings.append(f"兼容性检查失败: {e}")
 
         return warnings
 
+    def _find_grok_tab(self) -> str:
+        """返回已打开的 grok.com 标签页 targetId, 没有则返回空字符串"""
+        try:
+            tabs = self._browser.list_tabs()
+        except BrowserError:
+            return ""
+        for tab in tabs:
+            if tab.get("url", "").startswith(GROK_URL):
+                return tab.get("targetId", "")
+        return ""
+
     def extract(self, source: str = "") -> Iterator[Conversation]:
         """提取 Grok 对话
 
@@ -98,72 +334,107 @@ class GrokAdapter(BaseAdapter):
         # 打开 Grok
         tab = browser.open_tab(GROK_URL)
         target_id = tab.get("targetId", "")
+        tab_ids = [target_id]
 
         try:
-            browser.wait(target_id, load_state="networkidle", timeout_ms=20000)
+            browser.wait_ready(target_id, _HOME_READY_JS, timeout_ms=20000)
             browser.human_delay(2.0, 4.0)
 
             # 获取对话列表
             conversation_ids = self._get_conversation_list(target_id)
-            print(f"  发现 {len(conversation_ids)} 段 Grok 对话")
+            log.info("  发现 %d 段 Grok 对话", len(conversation_ids))
 
-            for i, conv_meta in enumerate(conversation_ids):
-                try:
-                    conv = self._extract_conversation(target_id, conv_meta, i + 1)
-                    if conv and conv.messages:
-                        yield conv
-                except Exception as e:
-                    print(f"  ✗ 提取对话失败: {conv_meta.get('title', '?')}: {e}")
+            # 额外打开标签页组成标签池, 每个工作线程独占一个标签页
+            for _ in range(min(TAB_POOL_SIZE, len(conversation_ids)) - 1):
+                tab = browser.open_tab(GROK_URL)
+                tab_ids.append(tab.get("targetId", ""))
 
-                browser.human_delay(2.0, 5.0)
+            yield from self._extract_parallel(tab_ids, conversation_ids)
 
         finally:
+            for tid in tab_ids:
+                try:
+                    browser.close_tab(tid)
+                except Exception:
+                    pass
+
+    def _extract_parallel(self, tab_ids: List[str],
+                          conversation_ids: List[dict]) -> Iterator[Conversation]:
+        """在标签池上并行提取对话, 按原始顺序产出
+
+        已提交任务按提交顺序放在 deque 中, 从队首取结果即可保序;
+        最多预先提交 2 倍标签数的任务, 避免消费方较慢时结果堆积。
+        """
+        browser = self._browser
+        tabs = queue.Queue()
+        for tid in tab_ids:
+            tabs.put(tid)
+
+        def work(index: int, conv_meta: dict) -> Optional[Conversation]:
+            tid = tabs.get()
+            ok = False
             try:
-                browser.close_tab(target_id)
-            except Exception:
-                pass
+                conv = self._extract_conversation(tid, conv_meta, index)
+                ok = True
+                return conv
+            except Exception as e:
+                log.warning("  ✗ 提取对话失败: %s: %s", conv_meta.get("title", "?"), e)
+                return None
+            finally:
+                # 延迟按标签页计, 而不是全局串行
+                browser.human_delay(*self._adapt_delay(ok))
+                tabs.put(tid)
+
+        window = 2 * len(tab_ids)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=len(tab_ids)) as pool:
+            try:
+                for i, conv_meta in enumerate(conversation_ids):
+                    pending.append(pool.submit(work, i + 1, conv_meta))
+                    if len(pending) >= window:
+                        conv = pending.popleft().result()
+                        if conv and conv.messages:
+                            yield conv
+                while pending:
+                    conv = pending.popleft().result()
+                    if conv and conv.messages:
+                        yield conv
+            finally:
+                # 生成器提前关闭时, 取消尚未开始的任务
+                for future in pending:
+                    future.cancel()
+
+    def _adapt_delay(self, ok: bool) -> tuple:
+        """根据上一段对话是否成功调整对话间延迟, 返回 (min_sec, max_sec)"""
+        with self._delay_lock:
+            if ok:
+                self._delay_lo = max(DELAY_FLOOR[0], self._delay_lo * DELAY_DECAY)
+                self._delay_hi = max(DELAY_FLOOR[1], self._delay_hi * DELAY_DECAY)
+            else:
+                self._delay_lo, self._delay_hi = DELAY_RANGE
+            return self._delay_lo, self._delay_hi
 
     def _get_conversation_list(self, target_id: str) -> List[dict]:
         """从侧边栏提取对话列表"""
         browser = self._browser
 
         # 用 JS 提取侧边栏对话链接
-        result = browser.evaluate("""() => {
-            const links = document.querySelectorAll('a[href*="/chat/"]');
-            return Array.from(links).map(a => ({
-                href: a.href,
-                title: a.textContent.trim(),
-                id: a.href.match(/\\/chat\\/([^/?]+)/)?.[1] || ''
-            })).filter(item => item.id);
-        }""", target_id)
+        result = browser.evaluate(_CONVERSATION_LINKS_JS, target_id)
 
         items = result.get("result", [])
         if not items:
             # 备选: 尝试其他选择器
-            result = browser.evaluate("""() => {
-                const items = document.querySelectorAll('[data-testid*="conversation"], [class*="conversation"]');
-                return Array.from(items).map(el => {
-                    const link = el.querySelector('a') || el.closest('a');
-                    const href = link?.href || '';
-                    return {
-                        href: href,
-                        title: el.textContent.trim().slice(0, 100),
-                        id: href.match(/\\/chat\\/([^/?]+)/)?.[1] || el.getAttribute('data-id') || ''
-                    };
-                }).filter(item => item.id || item.title);
-            }""", target_id)
+            result = browser.evaluate(_CONVERSATION_ITEMS_JS, target_id)
             items = result.get("result", [])
 
-        # 去重
-        seen = set()
-        unique = []
+        # 去重 (按 id, 无 id 时按标题; 保留首次出现的顺序)
+        unique = {}
         for item in items:
             key = item.get("id") or item.get("title", "")
-            if key and key not in seen:
-                seen.add(key)
-                unique.append(item)
+            if key:
+                unique.setdefault(key, item)
 
-        return unique
+        return list(unique.values())
 
     def _extract_conversation(self, target_id: str, conv_meta: dict,
                               index: int) -> Optional[Conversation]:
@@ -179,14 +450,10 @@ class GrokAdapter(BaseAdapter):
         else:
             browser.navigate(f"{GROK_URL}/chat/{conv_id}", target_id)
 
-        browser.wait(target_id, load_state="networkidle", timeout_ms=15000)
+        browser.wait_ready(target_id, _CONVERSATION_READY_JS, timeout_ms=15000)
         browser.human_delay(1.5, 3.0)
 
-        # 滚动到顶部加载全部消息
-        browser.scroll_to_top(target_id)
-        browser.human_delay(1.0, 2.0)
-
-        # 提取消息
+        # 滚动到顶部并提取消息 (单次 evaluate)
         messages = self._extract_messages(target_id)
 
         if not title and messages:
@@ -203,93 +470,43 @@ class GrokAdapter(BaseAdapter):
 
     def _extract_messages(self, target_id: str) -> List[Message]:
         """从当前页面提取所有消息"""
-        browser = self._browser
+        return list(self._iter_messages(target_id))
 
-        result = browser.evaluate("""() => {
-            const messages = [];
-
-            // 尝试多种选择器 (Grok UI 可能更新)
-            const selectors = [
-                '[data-testid*="message"]',
-                '[class*="message-row"]',
-                '[class*="MessageRow"]',
-                '.message',
-                '[role="article"]',
-            ];
-
-            let elements = [];
-            for (const sel of selectors) {
-                elements = document.querySelectorAll(sel);
-                if (elements.length > 0) break;
-            }
+    def _iter_messages(self, target_id: str) -> Iterator[Message]:
+        """分批从当前页面提取消息, 每收到一批即产出
 
-            // 备选: 按结构特征查找对话消息
-            if (elements.length === 0) {
-                // Grok 的消息通常在 main 区域内, 交替的 user/assistant 块
-                const main = document.querySelector('main') || document.querySelector('[role="main"]');
-                if (main) {
-                    // 查找 turn 容器 — 通常是直接子级 div
-                    const turns = main.querySelectorAll(':scope > div > div');
-                    elements = turns;
-                }
-            }
-
-            elements.forEach((el, idx) => {
-                const text = el.textContent.trim();
-                if (!text) return;
-
-                // 推断角色: 检查类名、data 属性、或位置 (偶数=user, 奇数=assistant)
-                let role = 'unknown';
-                const cls = el.className || '';
-                const dataRole = el.getAttribute('data-role') || el.getAttribute('data-message-author-role') || '';
-
-                if (dataRole) {
-                    role = dataRole.includes('user') ? 'user' :
-                           dataRole.includes('assistant') || dataRole.includes('grok') ? 'assistant' : dataRole;
-                } else if (cls.includes('user') || cls.includes('human')) {
-                    role = 'user';
-                } else if (cls.includes('assistant') || cls.includes('bot') || cls.includes('grok')) {
-                    role = 'assistant';
-                } else {
-                    // 按位置交替推断
-                    role = idx % 2 === 0 ? 'user' : 'assistant';
-                }
-
-                // 提取时间戳 (如果存在 time 或 datetime 元素)
-                const timeEl = el.querySelector('time');
-                const timestamp = timeEl?.getAttribute('datetime') || timeEl?.textContent || '';
-
-                messages.push({
-                    role: role,
-                    content: text.slice(0, 50000),
-                    timestamp: timestamp,
-                    index: idx
-                });
-            });
-
-            return messages;
-        }""", target_id)
-
-        raw_messages = result.get("result", [])
-
-        messages = []
-        for raw in raw_messages:
-            role = raw.get("role", "unknown")
-            if role == "unknown":
-                continue
-
-            content = raw.get("content", "").strip()
-            if not content:
-                continue
-
-            timestamp = raw.get("timestamp", "")
-            if timestamp and not timestamp.startswith("20"):
-                timestamp = ""
-
-            messages.append(Message(
-                role=role,
-                content=content,
-                timestamp=timestamp,
-            ))
-
-        return messages
+        首批由 _extract_messages_js() 生成的脚本返回, 之后按游标 next 调用
+        _EXTRACT_BATCH_JS, 直到 done。
+        """
+        browser = self._browser
+        match_timestamp = _ISO_TIMESTAMP_RE.match
+
+        # 选择器在首个打开的对话页上确定 (首页没有消息, 探测结果不可靠);
+        # 固定的选择器在某页未命中时, 该页退回完整的候选列表
+        variant = self._selector_variant
+        result = {}
+        if variant:
+            script = _extract_messages_js((variant,))
+            result = browser.evaluate(script, target_id).get("result") or {}
+        if not variant or not result.get("selector"):
+            result = browser.evaluate(_extract_messages_js(), target_id).get("result") or {}
+            if not variant and result.get("selector"):
+                self._selector_variant = result["selector"]
+        while True:
+            for raw in result.get("batch", ()):
+                role = raw.get("r", "unknown")
+                content = raw.get("c", "").strip()
+                if role == "unknown" or not content:
+                    continue
+
+                timestamp = raw.get("t", "")
+                yield Message(
+                    role=role,
+                    content=content,
+                    timestamp=timestamp if match_timestamp(timestamp) else "",
+                )
+
+            if result.get("done", True):
+                return
+            script = _EXTRACT_BATCH_JS % result.get("next", 0)
+            result = browser.evaluate(script, target_id).get("result") or {}
@@ -30,23 +30,53 @@
   python3 -m knowledge_harvester extract-wechat --key-file ~/.wechat_db_key
 """
 
+import functools
 import hashlib
+import html
+import io
+import itertools
 import json
+import operator
 import os
+import queue
 import re
 import shutil
 import sqlite3
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Iterator, List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from lxml import etree as _lxml_etree
+except ImportError:
+    _lxml_etree = None
+
+# SQLCipher Python 绑定: 进程内解密查询, 每个 DB 一个连接;
+# 未安装时回退到 sqlcipher CLI (每次查询一个子进程)
+try:
+    import sqlcipher3 as _sqlcipher
+except ImportError:
+    try:
+        from pysqlcipher3 import dbapi2 as _sqlcipher
+    except ImportError:
+        _sqlcipher = None
 
 try:
     import zstandard as _zstd
-    _zstd_decompressor = _zstd.ZstdDecompressor()
 except ImportError:
-    _zstd_decompressor = None
+    _zstd = None
+
+# sqlcipher CLI 的 JSON 输出: 安装了 ijson 时逐行流式解析
+try:
+    import ijson as _ijson
+except ImportError:
+    _ijson = None
 
 from .base import BaseAdapter
 from ..models import Conversation, MediaRef, Message
@@ -60,18 +90,146 @@ WECHAT_DATA_V4 = WECHAT_CONTAINER / "Data/Documents/xwechat_files"
 # WeChat 旧版路径
 WECHAT_DATA_LEGACY = WECHAT_CONTAINER / "Data/Library/Application Support/com.tencent.xinWeChat"
 
+# 整秒快速路径的范围 (32 位 time_t); 范围外的值走 datetime
+_MAX_UNIX_SECONDS = 2 ** 31
+
+
+# 与 datetime.isoformat() 相同的 UTC 整秒格式
+_ISO_UTC_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+
+def _unix_to_iso(seconds) -> str:
+    """Unix 秒 → ISO 8601 (UTC); 空值或无法表示的时间返回空串
+
+    32 位范围内的整秒 (绝大多数消息) 用 time.gmtime + strftime 直接格式化,
+    不构造带时区的 datetime 对象; 其余 (小数、负数、2038 年以后) 走 datetime。
+    """
+    if not seconds:
+        return ""
+    if type(seconds) is int and 0 < seconds < _MAX_UNIX_SECONDS:
+        return time.strftime(_ISO_UTC_FORMAT, time.gmtime(seconds))
+    try:
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+    except (ValueError, OSError, OverflowError):
+        return ""
+
+
+# 读取消息库时的连接参数 (见 _tune_read_conn); cache_size 为负数表示 KiB
+_READ_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+READ_MMAP_BYTES = 1 << 30
+
+# sqlcipher CLI 单次查询的超时 (秒)
+CLI_TIMEOUT_SECONDS = 60
+
+# 单个 DB 内并行读取 Msg_<hash> 表的最多线程数
+TABLE_WORKERS = 4
+
+# 同时提取的 message_*.db 数, 以及每个 DB 已读出但尚未交给调用方的对话数上限
+DB_WORKERS = 2
+DB_QUEUE_SIZE = 4
+
+# DB 工作线程放入队列的结束标记
+_DB_DONE = object()
+
+
+_SIZE_UNITS = ("B", "KB", "MB", "GB")
+
 
 def _format_size(size_bytes: int) -> str:
-    """格式化文件大小: 1234567 → '1.2MB'"""
+    """格式化文件大小: 1234567 → '1.2MB'
+
+    单位由 bit_length 直接算出 (每 10 位进一级), 不逐级比较。
+    """
     if size_bytes <= 0:
         return ""
-    if size_bytes < 1024:
+    idx = min((size_bytes.bit_length() - 1) // 10, 3)
+    if idx == 0:
         return f"{size_bytes}B"
-    if size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f}KB"
-    if size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f}MB"
-    return f"{size_bytes / (1024 * 1024 * 1024):.1f}GB"
+    return f"{size_bytes / (1 << (10 * idx)):.1f}{_SIZE_UNITS[idx]}"
+
+
+_xml_local = threading.local()
+
+if _lxml_etree is not None:
+    _XML_PARSE_ERRORS = (ET.ParseError, _lxml_etree.XMLSyntaxError, ValueError)
+else:
+    _XML_PARSE_ERRORS = (ET.ParseError,)
+
+
+def _xml_fromstring(xml_text: str):
+    """解析 XML 字符串, 安装了 lxml 时优先使用 (libxml2, 明显快于 ElementTree).
+
+    lxml 解析器不能跨线程共享, 每个线程各建一个; 关闭实体解析和网络访问,
+    避免消息内容中的外部实体被展开。
+    """
+    if _lxml_etree is None:
+        return ET.fromstring(xml_text)
+    parser = getattr(_xml_local, "parser", None)
+    if parser is None:
+        parser = _lxml_etree.XMLParser(resolve_entities=False, no_network=True)
+        _xml_local.parser = parser
+    # lxml 不接受带 encoding 声明的 str, 统一传 bytes
+    return _lxml_etree.fromstring(xml_text.encode("utf-8"), parser)
+
+
+# type=49 中只需要 title/des/url/type/appattach 几个字段的常见 sub-type:
+# 直接用正则提取, 不构建整棵 XML 树 (引用 57、聊天记录 19 等嵌套结构仍走完整解析)
+_TYPE49_FAST_SUBTYPES = frozenset({4, 5, 6, 33, 36, 51})
+
+# 超过此长度 (字符) 的 appmsg XML 用 iterparse 流式解析
+ITERPARSE_THRESHOLD_CHARS = 64 * 1024
+
+
+def _xml_tag_re(tag: str):
+    """匹配 <tag>文本</tag> 或 <tag><![CDATA[文本]]></tag> 的首次出现 (开始标签可带属性)"""
+    return re.compile(
+        rf"<{tag}(?:\s[^>]*)?(?<!/)>(?:<!\[CDATA\[(.*?)\]\]>|([^<]*))</{tag}>", re.DOTALL)
+
+
+_TYPE49_FIELD_RES = {
+    tag: _xml_tag_re(tag)
+    for tag in ("title", "des", "url", "totallen", "attachfilename")
+}
+_TYPE49_SUBTYPE_RE = re.compile(r"<type(?:\s[^>]*)?(?<!/)>\s*(\d+)\s*</type>")
+# 正则只取首次出现, 无法区分是否 appmsg 的直接子元素: 内嵌块 (appmsg/引用/
+# 聊天记录/公众号文章列表/小程序信息) 里也有 title、url、type 等同名字段,
+# 自闭合的字段 (<url/>) 则会让正则匹配到后面内嵌块中的同名字段;
+# 出现这两种情况时改用 XML 解析
+_TYPE49_NESTED_RE = re.compile(r"<(?:appmsg|refermsg|recorditem|mmreader|weappinfo)[\s/>]")
+_TYPE49_SELF_CLOSING_RE = re.compile(
+    r"<(?:title|des|url|type|totallen|attachfilename)(?:\s[^>]*)?/>")
+# XML 只认这几种实体; 其它 & (如 HTML 的 &nbsp;) 会让 XML 解析失败
+_NON_XML_AMP_RE = re.compile(r"&(?!(?:lt|gt|amp|quot|apos|#\d+|#x[0-9a-fA-F]+);)")
+
+
+def _xml_field(tag: str, xml_text: str, pos: int = 0,
+               strict: bool = True) -> Optional[str]:
+    """用正则从 pos 起取出字段文本 (CDATA 原样, 普通文本反转义实体)
+
+    文本中有 XML 不接受的 & 时: strict 返回 None (调用方改用 XML 解析),
+    否则原样返回文本。
+    """
+    m = _TYPE49_FIELD_RES[tag].search(xml_text, pos)
+    if m is None:
+        return ""
+    if m.group(1) is not None:
+        return m.group(1).strip()
+    text = m.group(2)
+    if "&" not in text:
+        return text.strip()
+    if _NON_XML_AMP_RE.search(text):
+        return None if strict else text.strip()
+    return html.unescape(text).strip()
+
+
+# 同一张卡片 (公众号文章、小程序等) 常被转发到多个聊天, 原文完全相同:
+# 按原始 XML 缓存解析结果; 超长 XML 很少重复, 不占缓存
+TYPE49_CACHE_SIZE = 4096
+TYPE49_CACHE_MAX_CHARS = 16 * 1024
 
 
 def _parse_type49_xml(raw_content: str) -> Tuple[str, List[MediaRef]]:
@@ -80,65 +238,158 @@ def _parse_type49_xml(raw_content: str) -> Tuple[str, List[MediaRef]]:
     Returns:
         (inline_label, media_refs) — Tier 0 展示文本 + Tier 1 媒体元数据
     """
+    if not raw_content or len(raw_content) > TYPE49_CACHE_MAX_CHARS:
+        return _parse_type49_uncached(raw_content)
+    label, refs = _parse_type49_cached(raw_content)
+    # 缓存的 MediaRef 是共享的, 后续会被填入本地路径: 每次返回副本
+    return label, [
+        MediaRef(type=m.type, path=m.path, original_url=m.original_url,
+                 filename=m.filename, size_bytes=m.size_bytes,
+                 description=m.description, summary=m.summary)
+        for m in refs
+    ]
+
+
+@functools.lru_cache(maxsize=TYPE49_CACHE_SIZE)
+def _parse_type49_cached(raw_content: str) -> Tuple[str, Tuple[MediaRef, ...]]:
+    label, refs = _parse_type49_uncached(raw_content)
+    return label, tuple(refs)
+
+
+def _parse_type49_uncached(raw_content: str) -> Tuple[str, List[MediaRef]]:
+    """_parse_type49_xml 的实际解析 (不经缓存)"""
     if not raw_content or not raw_content.strip():
         return "[链接/文件]", []
 
-    # 清理 XML: 去掉可能的前缀文本 (群消息会有 "wxid_xxx:\n" 前缀)
-    xml_text = raw_content
-    msg_idx = xml_text.find("<msg")
-    if msg_idx > 0:
-        xml_text = xml_text[msg_idx:]
-    elif not xml_text.strip().startswith("<"):
-        return "[链接/文件]", []
+    # 跳过可能的前缀文本 (群消息会有 "wxid_xxx:\n" 前缀): 只记录起始偏移,
+    # 正则快速路径直接从偏移处搜索, 不复制字符串
+    start = raw_content.find("<msg")
+    if start < 0:
+        if not raw_content.lstrip().startswith("<"):
+            return "[链接/文件]", []
+        start = 0
+
+    # 字段都在 appmsg 下: 正则从 <appmsg 处开始搜索 (没有 appmsg 时从根开始)
+    appmsg_pos = raw_content.find("<appmsg", start)
+    if appmsg_pos < 0:
+        appmsg_pos = start
+
+    # 快速路径: 常见 sub-type 只需几个字段, 正则提取即可
+    type_match = _TYPE49_SUBTYPE_RE.search(raw_content, appmsg_pos)
+    if (type_match and int(type_match.group(1)) in _TYPE49_FAST_SUBTYPES
+            and not _TYPE49_NESTED_RE.search(raw_content, appmsg_pos + 1)
+            and not _TYPE49_SELF_CLOSING_RE.search(raw_content, appmsg_pos)):
+        fields = {
+            tag: _xml_field(tag, raw_content, appmsg_pos)
+            for tag in ("title", "des", "url", "totallen", "attachfilename")
+        }
+        if None not in fields.values():
+            totallen = fields["totallen"]
+            return _type49_label(
+                int(type_match.group(1)),
+                title=fields["title"],
+                description=fields["des"],
+                url=fields["url"],
+                file_size=int(totallen) if totallen.isdigit() else 0,
+                attach_filename=fields["attachfilename"],
+            )
+
+    # XML 解析器需要从 <msg 开始的完整文档, 仅在此处切片
+    xml_text = raw_content[start:] if start else raw_content
 
-    # 解析 XML
+    # 解析 XML (超大 XML 流式解析, 只保留需要的字段)
     try:
-        root = ET.fromstring(xml_text)
-    except ET.ParseError:
-        # Regex fallback: 尝试提取 title
-        title_match = re.search(r"<title>([^<]+)</title>", raw_content)
-        if title_match:
-            title = title_match.group(1).strip()
+        if len(xml_text) > ITERPARSE_THRESHOLD_CHARS:
+            fields = _type49_fields_streaming(xml_text)
+        else:
+            fields = _type49_fields_tree(_xml_fromstring(xml_text))
+    except _XML_PARSE_ERRORS:
+        # Regex fallback: 用预编译的字段正则提取 title (同样支持 CDATA)
+        title = _xml_field("title", raw_content, appmsg_pos, strict=False)
+        if title:
             return f"[链接: {title}]", [MediaRef(type="link", filename=title)]
         return "[链接/文件]", []
 
-    appmsg = root.find("appmsg") or root
-    title_el = appmsg.find("title")
-    des_el = appmsg.find("des")
-    type_el = appmsg.find("type")
-    url_el = appmsg.find("url")
-
-    title = (title_el.text or "").strip() if title_el is not None else ""
-    description = (des_el.text or "").strip() if des_el is not None else ""
-    url = (url_el.text or "").strip() if url_el is not None else ""
-
     try:
-        sub_type = int(type_el.text) if type_el is not None and type_el.text else 0
-    except (ValueError, TypeError):
+        sub_type = int(fields.get("type") or 0)
+    except ValueError:
         sub_type = 0
-
-    # 文件附件信息
-    appattach = appmsg.find("appattach")
-    file_size = 0
-    file_ext = ""
-    attach_filename = ""
-    if appattach is not None:
-        totallen_el = appattach.find("totallen")
-        fileext_el = appattach.find("fileext")
-        filename_el = appattach.find("attachfilename")
-        if totallen_el is not None and totallen_el.text:
-            try:
-                file_size = int(totallen_el.text)
-            except ValueError:
-                pass
-        if fileext_el is not None:
-            file_ext = (fileext_el.text or "").strip()
-        if filename_el is not None:
-            attach_filename = (filename_el.text or "").strip()
-
+    try:
+        file_size = int(fields.get("totallen") or 0)
+    except ValueError:
+        file_size = 0
+
+    return _type49_label(
+        sub_type,
+        title=fields.get("title", ""),
+        description=fields.get("des", ""),
+        url=fields.get("url", ""),
+        file_size=file_size,
+        attach_filename=fields.get("attachfilename", ""),
+        ref_content=fields.get("ref_content", "")[:80] if sub_type == 57 else "",
+    )
+
+
+# appmsg 下需要的字段: 相对 appmsg 的路径 → 字段名
+_TYPE49_FIELD_PATHS = {
+    ("title",): "title",
+    ("des",): "des",
+    ("url",): "url",
+    ("type",): "type",
+    ("appattach", "totallen"): "totallen",
+    ("appattach", "attachfilename"): "attachfilename",
+    ("refermsg", "content"): "ref_content",
+}
+
+
+def _type49_fields_tree(root) -> dict:
+    """从已解析的 XML 树中取出 appmsg 字段"""
+    # 不能写成 root.find(...) or root: 元素的真值取决于子节点数 (lxml 会告警)
+    appmsg = root.find("appmsg")
+    if appmsg is None:
+        appmsg = root
+
+    fields = {}
+    for path, name in _TYPE49_FIELD_PATHS.items():
+        el = appmsg.find("/".join(path))
+        if el is not None:
+            fields[name] = (el.text or "").strip()
+    return fields
+
+
+def _type49_fields_streaming(xml_text: str) -> dict:
+    """用 iterparse 流式取出 appmsg 字段, 每个元素处理完即 clear.
+
+    合并转发的聊天记录 (sub_type=19) 等会内嵌很大的 XML, 整树解析要把
+    全部节点保留到解析结束; 这里内存只与需要的字段有关。
+    """
+    fields = {}
+    path = []
+    in_appmsg_child = False
+    for event, elem in ET.iterparse(io.BytesIO(xml_text.encode("utf-8")),
+                                    events=("start", "end")):
+        if event == "start":
+            path.append(elem.tag)
+            if len(path) == 2:
+                in_appmsg_child = path[1] == "appmsg"
+            continue
+
+        # 根下有 appmsg 时以它为基准, 否则根本身视为 appmsg (与整树解析一致)
+        rel = tuple(path[2:]) if in_appmsg_child else tuple(path[1:])
+        name = _TYPE49_FIELD_PATHS.get(rel)
+        if name and name not in fields:
+            fields[name] = (elem.text or "").strip()
+        elem.clear()
+        path.pop()
+    return fields
+
+
+def _type49_label(sub_type: int, title: str = "", description: str = "",
+                  url: str = "", file_size: int = 0, attach_filename: str = "",
+                  ref_content: str = "") -> Tuple[str, List[MediaRef]]:
+    """根据 appmsg sub-type 生成标签和 MediaRef"""
     filename = attach_filename or title
 
-    # 根据 appmsg sub-type 生成标签和 MediaRef
     if sub_type == 6:
         # 文件
         size_str = _format_size(file_size)
@@ -161,12 +412,6 @@ def _parse_type49_xml(raw_content: str) -> Tuple[str, List[MediaRef]]:
         media = [MediaRef(type="mini_program", filename=title, original_url=url)]
     elif sub_type == 57:
         # 引用消息
-        ref_content = ""
-        refermsg = appmsg.find("refermsg")
-        if refermsg is not None:
-            ref_content_el = refermsg.find("content")
-            if ref_content_el is not None:
-                ref_content = (ref_content_el.text or "").strip()[:80]
         label = f"[引用: {ref_content}]" if ref_content else "[引用]"
         # 引用消息本身可能包含 title 作为回复内容
         if title:
@@ -209,35 +454,128 @@ def _parse_type49_xml(raw_content: str) -> Tuple[str, List[MediaRef]]:
     return label, media
 
 
-def _decompress_content(hex_content: str) -> Optional[str]:
+# 只展示占位文本的消息类型: msg_type → (content_type, 占位文本, MediaRef 类型)
+# 字典查找代替逐个比较的 if/elif 链; MediaRef 是可变对象, 每条消息单独创建
+_V4_PLACEHOLDER_TYPES = {
+    3: ("image", "[图片]", "image"),
+    34: ("audio", "[语音]", "voice"),
+    43: ("video", "[视频]", "video"),
+    47: ("sticker", "[表情]", None),
+    48: ("location", "[位置]", None),
+}
+# 旧版 MSG 表只为媒体类型附加 MediaRef, 内容保持原样: msg_type → (content_type, MediaRef 类型)
+_MSG_MEDIA_TYPES = {
+    msg_type: (content_type, media_type)
+    for msg_type, (content_type, _, media_type) in _V4_PLACEHOLDER_TYPES.items()
+    if media_type
+}
+# 保留原始内容的类型: 文本、系统消息 (10000)、撤回消息 (10002)
+_V4_KEEP_CONTENT_TYPES = frozenset({1, 10000, 10002})
+
+
+# 压缩内容超过此大小时不解压 (正常消息只有几 KB, 避免异常数据占用大量内存)
+MAX_COMPRESSED_BYTES = 1 << 20
+# 帧头未记录原始大小时, 解压输出的上限
+MAX_DECOMPRESSED_BYTES = 1 << 24
+
+_zstd_local = threading.local()
+
+
+def _zstd_dctx():
+    """当前线程复用的 ZstdDecompressor (解压上下文不能跨线程共享)"""
+    dctx = getattr(_zstd_local, "dctx", None)
+    if dctx is None:
+        dctx = _zstd_local.dctx = _zstd.ZstdDecompressor()
+    return dctx
+
+
+# Zstandard 帧的 magic bytes, 以及 sqlite hex() 输出的对应前缀
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_ZSTD_MAGIC_HEX = ("28B52FFD", "28b52ffd")
+
+
+def _decompress_content(raw: bytes) -> Optional[str]:
     """解压 WCDB 压缩内容 (Zstandard).
 
     WeChat WCDB 使用 WCDB_CT_message_content 标记压缩:
     - CT=4: Zstandard 压缩 (magic bytes: 28 B5 2F FD)
 
     Args:
-        hex_content: 消息内容的十六进制编码
+        raw: 消息内容的原始字节 (BLOB)
 
     Returns:
         解压后的文本, 或 None 如果解压失败
     """
-    if not hex_content or not _zstd_decompressor:
-        return None
-    try:
-        raw = bytes.fromhex(hex_content)
-    except ValueError:
+    if not raw or _zstd is None or len(raw) > MAX_COMPRESSED_BYTES:
         return None
     # Zstandard magic: 28 B5 2F FD
-    if len(raw) >= 4 and raw[:4] == b'\x28\xb5\x2f\xfd':
+    if raw[:4] == _ZSTD_MAGIC:
         try:
-            decoded = _zstd_decompressor.decompress(raw)
+            # 帧头带原始大小时一次分配到位; 否则按上限流式解压
+            decoded = _zstd_dctx().decompress(raw, max_output_size=MAX_DECOMPRESSED_BYTES)
             return decoded.decode('utf-8', errors='replace')
         except Exception:
             pass
     return None
 
 
-def _derive_raw_key(master_password_hex: str, db_path: Path) -> str:
+# 派生结果的磁盘缓存: sha256(password || salt) → raw key (hex)
+# PBKDF2 256k 次迭代是启动阶段的主要开销, 而结果是确定的, 重复运行无需再算。
+# raw key 可直接解密数据库, 属于凭据: 只有设置环境变量 KEY_CACHE_ENV=1 时
+# 才读写磁盘缓存, 否则只在进程内存中缓存
+KEY_CACHE_PATH = Path.home() / ".cache" / "knowledge_harvester" / "wechat_keys.json"
+KEY_CACHE_ENV = "KH_WECHAT_KEY_CACHE"
+
+_key_cache: Optional[dict] = None
+_key_cache_lock = threading.Lock()
+
+
+def _key_cache_on_disk() -> bool:
+    """是否启用 raw key 磁盘缓存 (需显式设置 KEY_CACHE_ENV=1)"""
+    return os.environ.get(KEY_CACHE_ENV) == "1"
+
+
+def _load_key_cache() -> dict:
+    """读取 raw key 缓存 (每个进程只读一次); 未启用磁盘缓存、文件缺失或损坏时视为空"""
+    global _key_cache
+    if _key_cache is None:
+        if not _key_cache_on_disk():
+            _key_cache = {}
+            return _key_cache
+        try:
+            with open(KEY_CACHE_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+            _key_cache = data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            _key_cache = {}
+    return _key_cache
+
+
+def _save_key_cache():
+    """原子写入 raw key 缓存, 文件权限 0600 (仅当前用户可读); 未启用时不写盘"""
+    if not _key_cache_on_disk():
+        return
+    with _key_cache_lock:
+        data = json.dumps(_load_key_cache())
+    try:
+        KEY_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = KEY_CACHE_PATH.with_name(KEY_CACHE_PATH.name + ".tmp")
+        # 已存在的临时文件可能权限更宽: 删除后重建, 并显式设为 0600
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, KEY_CACHE_PATH)
+    except OSError:
+        pass  # 缓存只是加速, 写失败不影响提取
+
+
+def _derive_raw_key(master_password_hex: str, db_path: Path,
+                    persist: bool = True) -> str:
     """从 master password 和 DB 文件的 salt 派生 SQLCipher raw key.
 
     WeChat WCDB 加密流程:
@@ -246,6 +584,9 @@ def _derive_raw_key(master_password_hex: str, db_path: Path) -> str:
       3. PBKDF2-HMAC-SHA512(password, salt, 256000, dklen=32) → raw key
       4. raw key 用于 SQLCipher 默认配置 (page_size=4096)
 
+    结果缓存在内存中, 启用磁盘缓存时同时写入 KEY_CACHE_PATH;
+    persist=False 时只更新内存中的缓存, 由调用方批量写盘。
+
     Returns:
         64 字符十六进制 raw key
     """
@@ -254,8 +595,50 @@ def _derive_raw_key(master_password_hex: str, db_path: Path) -> str:
         salt = f.read(16)
     if len(salt) < 16:
         raise ValueError(f"DB 文件过小, 无法读取 salt: {db_path}")
-    derived = hashlib.pbkdf2_hmac("sha512", password, salt, 256000, dklen=32)
-    return derived.hex()
+
+    cache_key = hashlib.sha256(password + salt).hexdigest()
+    with _key_cache_lock:
+        cached = _load_key_cache().get(cache_key)
+    if cached:
+        return cached
+
+    raw_key = hashlib.pbkdf2_hmac("sha512", password, salt, 256000, dklen=32).hex()
+    with _key_cache_lock:
+        _load_key_cache()[cache_key] = raw_key
+    if persist:
+        _save_key_cache()
+    return raw_key
+
+
+def _derive_raw_keys(master_password_hex: str, db_paths: List[Path]) -> dict:
+    """并行为多个 DB 派生 raw key, 返回 {db_path: raw_key_hex}.
+
+    每个 DB 的 salt 不同, 派生之间完全独立。hashlib.pbkdf2_hmac (OpenSSL)
+    计算期间释放 GIL, 线程池即可占满多核, 无需多进程。
+    无法读取 salt 的 DB 不出现在结果中 (使用时再报错)。
+    """
+    def derive(db_path: Path) -> Tuple[Path, Optional[str]]:
+        try:
+            return db_path, _derive_raw_key(master_password_hex, db_path, persist=False)
+        except (OSError, ValueError):
+            return db_path, None
+
+    with _key_cache_lock:
+        cached_before = len(_load_key_cache())
+
+    workers = min(len(db_paths), os.cpu_count() or 1)
+    if workers <= 1:
+        results = list(map(derive, db_paths))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(derive, db_paths))
+
+    # 有新派生的 key 时写一次盘
+    with _key_cache_lock:
+        changed = len(_load_key_cache()) != cached_before
+    if changed:
+        _save_key_cache()
+    return {path: key for path, key in results if key is not None}
 
 
 class WeChatAdapter(BaseAdapter):
@@ -271,7 +654,15 @@ class WeChatAdapter(BaseAdapter):
         self._data_dir = Path(data_dir) if data_dir else None
         self._sqlcipher_bin = shutil.which("sqlcipher") or ""
         self._contact_map: dict = {}  # md5_hash → {username, nick_name, remark}
+        self._pending_contacts: Iterator = iter(())  # 尚未计算 MD5 的联系人行
+        self._contact_lock = threading.Lock()  # 多个 DB 线程共享联系人查找
+        self._raw_keys: dict = {}  # db_path → 派生好的 raw key
+        self._cipher_conns: dict = {}  # (db_path, 线程 ID) → sqlcipher3 连接 (使用绑定时)
+        self._cipher_lock = threading.Lock()  # 保护 _cipher_conns 的增删与遍历
+        self._table_workers = 1  # 单个 DB 内读表的线程数 (extract 中按 DB 数设定)
         self._wechat_user_root: Optional[Path] = None  # WeChat user data root
+        self._dir_cache: dict = {}  # 媒体目录 → 文件名集合 (每个目录只列一次)
+        self._thumb_index: dict = {}  # Thumb 目录 → {local_id: 缩略图文件名}
 
     @property
     def platform(self) -> str:
@@ -281,7 +672,7 @@ class WeChatAdapter(BaseAdapter):
         """检查微信数据目录和数据库可用性"""
         warnings = []
 
-        if self._db_key and not self._sqlcipher_bin:
+        if self._db_key and not self._sqlcipher_bin and _sqlcipher is None:
             warnings.append(
                 "需要安装 sqlcipher CLI 来解密微信数据库:\n"
                 "  brew install sqlcipher"
@@ -362,13 +753,74 @@ class WeChatAdapter(BaseAdapter):
 
         # 加载联系人映射 (用于将 Msg_<md5> → 真实名称)
         if self._db_key:
+            # 先一次性并行派生所有 DB (含 contact.db) 的 raw key
+            key_dbs = [p for p in msg_dbs if p not in self._raw_keys]
+            contact_db = self._contact_db_path(msg_dbs)
+            if contact_db is not None and contact_db not in self._raw_keys:
+                key_dbs.append(contact_db)
+            self._raw_keys.update(_derive_raw_keys(self._db_key, key_dbs))
             self._load_contact_map(msg_dbs)
 
-        for db_path in msg_dbs:
-            try:
-                yield from self._extract_from_db(db_path)
-            except Exception as e:
-                print(f"  ✗ {db_path.name}: {e}")
+        # DB 级与表级线程总数不超过 CPU 数
+        db_workers = min(DB_WORKERS, len(msg_dbs))
+        self._table_workers = max(1, min(TABLE_WORKERS, (os.cpu_count() or 4) // db_workers))
+
+        if len(msg_dbs) == 1:
+            yield from self._extract_db_safely(msg_dbs[0])
+        else:
+            yield from self._extract_dbs_parallel(msg_dbs)
+
+    def _extract_db_safely(self, db_path: Path) -> Iterator[Conversation]:
+        """提取单个 DB, 出错时打印并跳过 (不影响其它 DB)"""
+        try:
+            yield from self._extract_from_db(db_path)
+        except Exception as e:
+            print(f"  ✗ {db_path.name}: {e}")
+
+    def _extract_dbs_parallel(self, msg_dbs: List[Path]) -> Iterator[Conversation]:
+        """多个 message_*.db 并行提取, 仍按 DB 顺序产出对话
+
+        各 DB 互相独立, 耗时主要在 SQLCipher 解密读页和 zstd 解压,
+        两者都在 C 代码中释放 GIL, 用线程即可并行 (连接、解压上下文都是
+        线程各自的)。同时最多 DB_WORKERS 个 DB 在提取, 每个 DB 的对话经
+        有界队列逐段交给调用方, 内存中不会积压整个 DB。调用方提前停止时
+        通知工作线程放弃, 不等待正在进行的 DB。
+        """
+        workers = min(len(msg_dbs), DB_WORKERS)
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wechat-db")
+
+        def start(db_path: Path) -> queue.Queue:
+            out = queue.Queue(maxsize=DB_QUEUE_SIZE)
+            pool.submit(self._stream_db, db_path, out, stop)
+            return out
+
+        remaining = iter(msg_dbs)
+        pending = deque(start(db_path) for db_path in itertools.islice(remaining, workers))
+        try:
+            while pending:
+                conv = pending[0].get()
+                if conv is _DB_DONE:
+                    pending.popleft()
+                    db_path = next(remaining, None)
+                    if db_path is not None:
+                        pending.append(start(db_path))
+                    continue
+                yield conv
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _stream_db(self, db_path: Path, out: queue.Queue, stop: threading.Event):
+        """在工作线程中提取单个 DB, 对话逐段放入 out, 结束时放入 _DB_DONE"""
+        conversations = self._extract_db_safely(db_path)
+        try:
+            for conv in conversations:
+                if not _put_unless_stopped(out, conv, stop):
+                    return
+        finally:
+            conversations.close()
+            _put_unless_stopped(out, _DB_DONE, stop)
 
     def _find_message_dbs(self) -> List[Path]:
         """自动查找微信消息数据库文件"""
@@ -402,42 +854,83 @@ class WeChatAdapter(BaseAdapter):
         return sorted(db_files)
 
     def _load_contact_map(self, msg_dbs: List[Path]):
-        """从 contact.db 加载联系人映射: MD5(username) → display name"""
+        """从 contact.db 加载联系人, 供 _lookup_contact 按 MD5(username) 查找
+
+        这里只读取行, 不计算 MD5: 消息库通常只涉及一小部分联系人,
+        由 _lookup_contact 按需计算, 命中即停。
+        """
         if not msg_dbs:
             return
 
-        # contact.db 在 db_storage/contact/ 目录 (与 message/ 同级)
-        db_storage = msg_dbs[0].parent.parent
-        contact_db = db_storage / "contact" / "contact.db"
-        if not contact_db.exists():
+        contact_db = self._contact_db_path(msg_dbs)
+        if contact_db is None:
             return
 
-        raw_key = _derive_raw_key(self._db_key, contact_db)
+        raw_key = self._raw_key(contact_db)
         rows = self._sqlcipher_query(
             contact_db, raw_key,
             "SELECT username, nick_name, remark FROM contact;"
         )
+        self._close_cipher_conn(contact_db)
         if not rows:
             return
 
-        for row in rows:
-            try:
-                username = str(row[0] or "")
-                nick = str(row[1] or "")
-                remark = str(row[2] or "")
-            except IndexError:
-                continue
-            if not username:
+        self._pending_contacts = iter(rows)
+        print(f"  加载了 {len(rows)} 个联系人映射")
+
+    def _lookup_contact(self, table_hash: str) -> dict:
+        """按 Msg_<md5> 中的 md5 查找联系人, 未找到返回空 dict
+
+        依次为尚未处理的联系人计算 MD5(username) 并缓存, 找到目标即返回;
+        每个联系人最多计算一次。
+        """
+        contact = self._contact_map.get(table_hash)
+        if contact is not None:
+            return contact
+        with self._contact_lock:
+            return self._hash_pending_contacts(table_hash)
+
+    def _hash_pending_contacts(self, table_hash: str) -> dict:
+        """继续为未处理的联系人计算 MD5, 直到找到 table_hash (需持有 _contact_lock)"""
+        contact = self._contact_map.get(table_hash)
+        if contact is not None:
+            return contact
+
+        # MD5 在这里只是查找键, 不是安全用途: usedforsecurity=False 跳过 FIPS 检查
+        md5 = hashlib.md5
+        contact_map = self._contact_map
+        for row in self._pending_contacts:
+            if len(row) < 3 or not row[0]:
                 continue
-            md5 = hashlib.md5(username.encode()).hexdigest()
-            self._contact_map[md5] = {
+            username = str(row[0])
+            nick = str(row[1] or "")
+            remark = str(row[2] or "")
+            key = md5(username.encode("utf-8"), usedforsecurity=False).hexdigest()
+            contact = contact_map[key] = {
                 "username": username,
                 "nick_name": nick,
                 "remark": remark,
                 "display": remark or nick or username,
             }
+            if key == table_hash:
+                return contact
+        return {}
+
+    @staticmethod
+    def _contact_db_path(msg_dbs: List[Path]) -> Optional[Path]:
+        """contact.db 在 db_storage/contact/ 目录 (与 message/ 同级)"""
+        if not msg_dbs:
+            return None
+        contact_db = msg_dbs[0].parent.parent / "contact" / "contact.db"
+        return contact_db if contact_db.exists() else None
 
-        print(f"  加载了 {len(self._contact_map)} 个联系人映射")
+    def _raw_key(self, db_path: Path) -> str:
+        """取 DB 的 raw key (优先使用已派生的结果)"""
+        raw_key = self._raw_keys.get(db_path)
+        if raw_key is None:
+            raw_key = _derive_raw_key(self._db_key, db_path)
+            self._raw_keys[db_path] = raw_key
+        return raw_key
 
     def _extract_from_db(self, db_path: Path) -> Iterator[Conversation]:
         """从单个数据库文件提取对话"""
@@ -450,6 +943,7 @@ class WeChatAdapter(BaseAdapter):
         """尝试以非加密方式打开数据库 (适用于部分旧版本或已解密数据库)"""
         try:
             conn = sqlite3.connect(str(db_path))
+            _tune_read_conn(conn, mmap=True)
             cursor = conn.cursor()
 
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -472,22 +966,20 @@ class WeChatAdapter(BaseAdapter):
 
     def _read_unencrypted_msg(self, conn, db_name: str) -> Iterator[Conversation]:
         """读取未加密 MSG 表"""
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT DISTINCT StrTalker FROM MSG "
-            "WHERE StrTalker IS NOT NULL AND StrTalker != '' ORDER BY StrTalker"
+        # 一次扫描整张表, 按 talker 排序后分组; 游标逐批取行,
+        # 不再为每个 talker 单独查询并 fetchall。
+        # 只取 _parse_msg_row 用到的列, StrTalker 放在末尾作分组键
+        cursor = conn.execute(
+            "SELECT MsgSvrID, Type, IsSender, CreateTime, StrContent, "
+            "StrTalker FROM MSG "
+            "WHERE StrTalker IS NOT NULL AND StrTalker != '' "
+            "ORDER BY StrTalker, CreateTime ASC"
         )
-        talkers = [row[0] for row in cursor.fetchall()]
-
-        for talker in talkers:
-            cursor.execute(
-                "SELECT MsgSvrID, Type, SubType, IsSender, CreateTime, "
-                "StrTalker, StrContent, DisplayContent FROM MSG "
-                "WHERE StrTalker = ? ORDER BY CreateTime ASC", (talker,)
-            )
+        parse = self._parse_msg_row
+        for talker, rows in itertools.groupby(cursor, key=operator.itemgetter(5)):
             messages = []
-            for row in cursor.fetchall():
-                msg = self._parse_msg_row(list(row))
+            for row in rows:
+                msg = parse(row)
                 if msg:
                     messages.append(msg)
             if messages:
@@ -520,15 +1012,8 @@ class WeChatAdapter(BaseAdapter):
                 if not content.strip():
                     continue
                 role = "user" if row[2] else "assistant"
-                timestamp = ""
-                if row[3]:
-                    try:
-                        dt = datetime.fromtimestamp(row[3], tz=timezone.utc)
-                        timestamp = dt.isoformat()
-                    except (ValueError, OSError):
-                        pass
                 messages.append(Message(
-                    role=role, content=content, timestamp=timestamp,
+                    role=role, content=content, timestamp=_unix_to_iso(row[3]),
                     message_id=str(row[0] or ""),
                 ))
             if messages:
@@ -539,15 +1024,22 @@ class WeChatAdapter(BaseAdapter):
                 )
 
     def _extract_encrypted(self, db_path: Path) -> Iterator[Conversation]:
-        """使用 sqlcipher CLI 解密数据库并提取对话"""
-        if not self._sqlcipher_bin:
+        """使用 sqlcipher (Python 绑定或 CLI) 解密数据库并提取对话"""
+        if not self._sqlcipher_bin and _sqlcipher is None:
             raise RuntimeError(
                 "需要安装 sqlcipher CLI 来解密微信数据库:\n"
                 "  brew install sqlcipher"
             )
 
-        # 为每个 DB 派生 raw key
-        raw_key = _derive_raw_key(self._db_key, db_path)
+        # 每个 DB 的 raw key (通常已在 extract 中并行派生)
+        raw_key = self._raw_key(db_path)
+        try:
+            yield from self._extract_encrypted_tables(db_path, raw_key)
+        finally:
+            self._close_cipher_conn(db_path)
+
+    def _extract_encrypted_tables(self, db_path: Path, raw_key: str) -> Iterator[Conversation]:
+        """按表结构分派到对应的读取方法"""
 
         # 查询所有表名
         tables = self._sqlcipher_query(
@@ -570,13 +1062,89 @@ class WeChatAdapter(BaseAdapter):
             print(f"  ⚠ {db_path.name}: 解密成功但未找到消息表 (找到: {', '.join(table_names[:10])})")
 
     def _sqlcipher_query(self, db_path: Path, raw_key: str, sql: str) -> Optional[List[list]]:
+        """执行解密查询, 返回行列表; 解密失败返回 None
+
+        安装了 sqlcipher3/pysqlcipher3 时在进程内执行并复用该 DB 的连接,
+        否则通过 sqlcipher CLI。
+        """
+        if _sqlcipher is not None:
+            return self._sqlcipher_query_native(db_path, raw_key, sql)
+        return self._sqlcipher_query_cli(db_path, raw_key, sql)
+
+    def _sqlcipher_query_native(self, db_path: Path, raw_key: str,
+                                sql: str) -> Optional[List[tuple]]:
+        """通过 SQLCipher Python 绑定执行查询 (每个 DB 只打开一次连接)"""
+        try:
+            return self._cipher_conn(db_path, raw_key).execute(sql).fetchall()
+        except _sqlcipher.DatabaseError:
+            # 密钥无效 ("file is not a database") 或表不存在
+            self._drop_cipher_conn(db_path)
+            return None
+
+    def _sqlcipher_rows(self, db_path: Path, raw_key: str, sql: str) -> Optional[Iterable]:
+        """执行解密查询, 返回可迭代的行; 解密失败返回 None
+
+        使用 Python 绑定时直接返回游标, 按 arraysize 分批取行,
+        不把整张表读进内存; CLI 方式经管道逐行解析输出。
+        """
+        if _sqlcipher is None:
+            return self._sqlcipher_stream_cli(db_path, raw_key, sql)
+        try:
+            cursor = self._cipher_conn(db_path, raw_key).cursor()
+            cursor.arraysize = 1000
+            cursor.execute(sql)
+        except _sqlcipher.DatabaseError:
+            self._drop_cipher_conn(db_path)
+            return None
+        return _iter_cursor(cursor)
+
+    def _cipher_conn(self, db_path: Path, raw_key: str):
+        """取当前线程对该 DB 的 SQLCipher 连接, 首次使用时打开并设置密钥
+
+        每个线程各用一个连接 (并行读表时互不阻塞); 允许跨线程关闭,
+        以便 DB 读完后由调用方统一关闭。
+        PRAGMA key 本身不校验密钥, 密钥错误在第一次查询时才报 DatabaseError。
+        """
+        key = (db_path, threading.get_ident())
+        conn = self._cipher_conns.get(key)
+        if conn is None:
+            conn = _sqlcipher.connect(str(db_path), check_same_thread=False)
+            conn.execute(f"PRAGMA key = \"x'{raw_key}'\"")
+            _tune_read_conn(conn)
+            with self._cipher_lock:
+                self._cipher_conns[key] = conn
+        return conn
+
+    def _drop_cipher_conn(self, db_path: Path):
+        """关闭当前线程对该 DB 的连接 (查询出错后)"""
+        with self._cipher_lock:
+            conn = self._cipher_conns.pop((db_path, threading.get_ident()), None)
+        if conn is not None:
+            conn.close()
+
+    def _close_cipher_conn(self, db_path: Path):
+        """关闭 DB 的全部 SQLCipher 连接 (各线程的)"""
+        with self._cipher_lock:
+            keys = [key for key in self._cipher_conns if key[0] == db_path]
+            conns = [self._cipher_conns.pop(key) for key in keys]
+        for conn in conns:
+            conn.close()
+
+    def close(self):
+        """关闭所有仍打开的 SQLCipher 连接"""
+        with self._cipher_lock:
+            db_paths = {db_path for db_path, _ in self._cipher_conns}
+        for db_path in db_paths:
+            self._close_cipher_conn(db_path)
+
+    def _sqlcipher_query_cli(self, db_path: Path, raw_key: str, sql: str) -> Optional[List[list]]:
         """通过 sqlcipher CLI 执行查询, 返回行列表"""
         commands = f"PRAGMA key = \"x'{raw_key}'\";\n.mode json\n{sql}\n"
         try:
             result = subprocess.run(
                 [self._sqlcipher_bin, str(db_path)],
                 input=commands.encode("utf-8"),
-                capture_output=True, timeout=60,
+                capture_output=True, timeout=CLI_TIMEOUT_SECONDS,
             )
         except subprocess.TimeoutExpired:
             return None
@@ -585,31 +1153,36 @@ class WeChatAdapter(BaseAdapter):
         if "file is not a database" in stderr:
             return None
 
-        output = result.stdout.decode("utf-8", errors="replace").strip()
-        if not output or output == "ok":
-            return []
-
-        # sqlcipher .mode json outputs multi-line JSON arrays.
-        # Extract JSON by finding [ ... ] blocks (skip "ok" lines from PRAGMAs).
-        # Collect all text after the first "[" until we have valid JSON.
-        json_start = output.find("[")
-        if json_start >= 0:
-            json_text = output[json_start:]
-            try:
-                parsed = json.loads(json_text)
-                if isinstance(parsed, list):
-                    return [[v for v in row.values()] for row in parsed]
-            except (json.JSONDecodeError, AttributeError):
-                pass
+        return list(_iter_cli_rows(result.stdout))
 
-        # Fallback: parse pipe-separated output
-        rows = []
-        for line in output.split("\n"):
-            line = line.strip()
-            if line and line != "ok" and "|" in line:
-                rows.append(line.split("|"))
+    def _sqlcipher_stream_cli(self, db_path: Path, raw_key: str, sql: str) -> Iterator[list]:
+        """通过 sqlcipher CLI 执行查询, 经管道边读边解析 stdout
 
-        return rows if rows else []
+        不把整个输出缓存为 bytes 再解码, 配合 ijson 时内存只与单行有关。
+        解密失败时 stdout 为空, 不产出任何行。
+        """
+        commands = f"PRAGMA key = \"x'{raw_key}'\";\n.mode json\n{sql}\n"
+        proc = subprocess.Popen(
+            [self._sqlcipher_bin, str(db_path)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        # 超时只约束首批输出之前 (密钥错误/数据库被锁时进程可能挂住);
+        # 开始输出后读取速度取决于调用方, 不再计时
+        timer = threading.Timer(CLI_TIMEOUT_SECONDS, proc.kill)
+        timer.start()
+        try:
+            proc.stdin.write(commands.encode("utf-8"))
+            proc.stdin.close()
+            proc.stdout.peek(1)
+            timer.cancel()
+            yield from _iter_cli_stream(proc.stdout)
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
 
     def _read_wcdb_v4_tables(self, db_path: Path, raw_key: str,
                               msg_tables: List[str]) -> Iterator[Conversation]:
@@ -627,53 +1200,90 @@ class WeChatAdapter(BaseAdapter):
                 except (ValueError, IndexError):
                     pass
 
-        for table_name in msg_tables:
-            # Include hex(message_content) for compressed message recovery
-            rows = self._sqlcipher_query(
-                db_path, raw_key,
-                f"SELECT local_id, server_id, local_type, real_sender_id, "
-                f"create_time, status, message_content, "
-                f"WCDB_CT_message_content, "
-                f"CASE WHEN WCDB_CT_message_content != 0 "
-                f"THEN hex(message_content) ELSE '' END "
-                f"FROM {table_name} ORDER BY create_time ASC;"
-            )
-            if not rows:
-                continue
-
-            messages = []
-            for row in rows:
-                msg = self._parse_v4_msg_row(row)
-                if msg:
-                    messages.append(msg)
+        # Python 绑定直接返回压缩内容的 BLOB; CLI 文本输出需额外带出
+        # hex(message_content) 才能恢复压缩消息
+        hex_column = ""
+        if _sqlcipher is None:
+            hex_column = (", CASE WHEN WCDB_CT_message_content != 0 "
+                          "THEN hex(message_content) ELSE '' END")
+
+        def read(table_name: str) -> Optional[Conversation]:
+            return self._read_v4_table(db_path, raw_key, table_name, hex_column)
+
+        workers = min(self._table_workers, len(msg_tables))
+        if workers <= 1:
+            for table_name in msg_tables:
+                conv = read(table_name)
+                if conv is not None:
+                    yield conv
+            return
 
-            if not messages:
-                continue
+        # 各表互相独立: 解密读页、zstd 解压在 C 中释放 GIL, 多线程可重叠;
+        # 窗口内最多 workers 张表在处理中, 仍按表顺序产出
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wechat-table")
+        remaining = iter(msg_tables)
+        pending = deque(
+            pool.submit(read, table_name)
+            for table_name in itertools.islice(remaining, workers)
+        )
+        try:
+            while pending:
+                conv = pending.popleft().result()
+                table_name = next(remaining, None)
+                if table_name is not None:
+                    pending.append(pool.submit(read, table_name))
+                if conv is not None:
+                    yield conv
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _read_v4_table(self, db_path: Path, raw_key: str, table_name: str,
+                       hex_column: str) -> Optional[Conversation]:
+        """读取单张 Msg_<hash> 表为一段对话, 无消息时返回 None"""
+        rows = self._sqlcipher_rows(
+            db_path, raw_key,
+            f"SELECT local_id, server_id, local_type, real_sender_id, "
+            f"create_time, status, message_content, "
+            f"WCDB_CT_message_content{hex_column} "
+            f"FROM {table_name} ORDER BY create_time ASC;"
+        )
+        if rows is None:
+            return None
 
-            # Resolve media file paths on disk
-            table_hash = table_name.replace("Msg_", "")
-            self._resolve_media_paths(messages, table_hash)
+        # 逐行解析 (压缩内容按批并行解压), 同时只有当前对话的消息常驻内存
+        messages = []
+        for row in _iter_decompressed_rows(rows):
+            msg = self._parse_v4_msg_row(row)
+            if msg:
+                messages.append(msg)
 
-            # Map Msg_<md5> → contact name via MD5(username)
-            contact = self._contact_map.get(table_hash, {})
-            username = contact.get("username", "")
-            display_name = contact.get("display", table_hash)
-            is_group = "@chatroom" in username
+        if not messages:
+            return None
 
-            conv_id = f"wechat-{_sanitize_id(username or table_hash)}"
-            yield Conversation(
-                id=conv_id,
-                platform="wechat",
-                title=display_name,
-                participants=[username] if username and not is_group else [],
-                messages=messages,
-                metadata={
-                    "table": table_name,
-                    "username": username,
-                    "is_group": is_group,
-                    "db_file": db_path.name,
-                },
-            )
+        # Resolve media file paths on disk
+        table_hash = table_name.replace("Msg_", "")
+        self._resolve_media_paths(messages, table_hash)
+
+        # Map Msg_<md5> → contact name via MD5(username)
+        contact = self._lookup_contact(table_hash)
+        username = contact.get("username", "")
+        display_name = contact.get("display", table_hash)
+        is_group = "@chatroom" in username
+
+        conv_id = f"wechat-{_sanitize_id(username or table_hash)}"
+        return Conversation(
+            id=conv_id,
+            platform="wechat",
+            title=display_name,
+            participants=[username] if username and not is_group else [],
+            messages=messages,
+            metadata={
+                "table": table_name,
+                "username": username,
+                "is_group": is_group,
+                "db_file": db_path.name,
+            },
+        )
 
     def _resolve_media_paths(self, messages: List[Message],
                               contact_hash: str) -> None:
@@ -703,20 +1313,18 @@ class WeChatAdapter(BaseAdapter):
 
                 if m.type == "file" and m.filename and yyyy_mm:
                     # Files: msg/file/YYYY-MM/<filename>
-                    candidate = root / "msg" / "file" / yyyy_mm / m.filename
-                    if candidate.exists():
-                        m.path = str(candidate)
+                    file_dir = root / "msg" / "file" / yyyy_mm
+                    if m.filename in self._listdir(file_dir):
+                        m.path = str(file_dir / m.filename)
 
                 elif m.type == "video" and yyyy_mm:
                     # Videos: msg/video/YYYY-MM/ — match by nearby timestamps
                     video_dir = root / "msg" / "video" / yyyy_mm
-                    if video_dir.exists():
-                        # Look for .mp4 files (not _thumb.jpg)
-                        mp4s = list(video_dir.glob("*.mp4"))
-                        if mp4s:
-                            # Best-effort: can't reliably map without msg_id,
-                            # but we can confirm videos exist for this month
-                            m.path = str(video_dir)
+                    # Look for .mp4 files (not _thumb.jpg)
+                    if any(name.endswith(".mp4") for name in self._listdir(video_dir)):
+                        # Best-effort: can't reliably map without msg_id,
+                        # but we can confirm videos exist for this month
+                        m.path = str(video_dir)
 
                 elif m.type == "image":
                     # Cache thumbnails: identifiable by local_id
@@ -736,36 +1344,76 @@ class WeChatAdapter(BaseAdapter):
         if not root:
             return None
         thumb_dir = root / "cache" / yyyy_mm / "Message" / contact_hash / "Thumb"
-        if not thumb_dir.exists():
-            return None
-        pattern = f"{local_id}_*_thumb.jpg"
-        matches = list(thumb_dir.glob(pattern))
-        return matches[0] if matches else None
+        index = self._thumb_index.get(thumb_dir)
+        if index is None:
+            # {local_id}_{ts}_thumb.jpg: 整个目录只扫描一次, 按 local_id 建索引
+            index = {}
+            for name in sorted(self._listdir(thumb_dir)):
+                prefix, sep, rest = name.partition("_")
+                if sep and rest.endswith("_thumb.jpg"):
+                    index.setdefault(prefix, name)
+            self._thumb_index[thumb_dir] = index
+        name = index.get(local_id)
+        return thumb_dir / name if name else None
+
+    def _listdir(self, path: Path) -> frozenset:
+        """目录中的文件名集合 (不含隐藏文件), 结果缓存; 目录不存在时为空集
+
+        同一对话的大量媒体消息落在相同的 YYYY-MM 目录下,
+        缓存列表后每条消息只需一次集合查找, 不再逐条 stat。
+        """
+        names = self._dir_cache.get(path)
+        if names is None:
+            try:
+                with os.scandir(path) as it:
+                    names = frozenset(e.name for e in it if not e.name.startswith("."))
+            except OSError:
+                names = frozenset()
+            self._dir_cache[path] = names
+        return names
 
     def _parse_v4_msg_row(self, row) -> Optional[Message]:
         """解析 WCDB v4 Msg_<hash> 表的一行
 
         Schema: local_id, server_id, local_type, real_sender_id,
                 create_time, status, message_content, WCDB_CT_message_content,
-                hex_content (CASE WHEN compressed)
+                [hex_content (CASE WHEN compressed) — 仅 CLI 方式]
         """
         try:
             local_id = row[0] or ""
             raw_type = int(row[2] or 0)
             create_time = int(row[4] or 0)
             status = int(row[5] or 0)
-            content = str(row[6] or "")
+            content = row[6] or ""
             compression = int(row[7] or 0) if len(row) > 7 else 0
-            hex_content = str(row[8] or "") if len(row) > 8 else ""
         except (ValueError, IndexError):
             return None
 
+        # 压缩内容的原始字节: Python 绑定直接返回 BLOB;
+        # CLI 只能输出文本, 由 hex 列带出
+        compressed = b""
+        if isinstance(content, bytes):
+            if compression != 0:
+                compressed = content
+                content = ""
+            else:
+                content = content.decode("utf-8", errors="replace")
+        else:
+            content = str(content)
+            # 不是 zstd 的内容无法解压, 先比较 hex 前缀, 不解码整个 hex 串
+            if (compression != 0 and len(row) > 8 and row[8]
+                    and row[8].startswith(_ZSTD_MAGIC_HEX)):
+                try:
+                    compressed = bytes.fromhex(row[8])
+                except ValueError:
+                    pass
+
         # local_type: low 16 bits = message type, high bits = sub-type
         msg_type = raw_type & 0xFFFF
 
         # Decompress content (Zstandard) if compressed
-        if compression != 0 and hex_content:
-            decompressed = _decompress_content(hex_content)
+        if compression != 0 and compressed:
+            decompressed = _decompress_content(compressed)
             if decompressed:
                 content = decompressed
                 compression = 0  # Treat as uncompressed from here on
@@ -781,82 +1429,55 @@ class WeChatAdapter(BaseAdapter):
         content_type = "text"
         media: List[MediaRef] = []
 
-        if msg_type == 3:
-            content_type = "image"
-            content = "[图片]"
-            media = [MediaRef(type="image")]
-        elif msg_type == 34:
-            content_type = "audio"
-            content = "[语音]"
-            media = [MediaRef(type="voice")]
-        elif msg_type == 43:
-            content_type = "video"
-            content = "[视频]"
-            media = [MediaRef(type="video")]
-        elif msg_type == 47:
-            content_type = "sticker"
-            content = "[表情]"
-        elif msg_type == 48:
-            content_type = "location"
-            content = "[位置]"
+        placeholder = _V4_PLACEHOLDER_TYPES.get(msg_type)
+        if placeholder is not None:
+            content_type, content, media_type = placeholder
+            if media_type:
+                media = [MediaRef(type=media_type)]
         elif msg_type == 49:
             content_type = "link"
             if compression != 0 and not content.strip().startswith("<"):
                 content = "[链接/文件]"
             else:
                 content, media = _parse_type49_xml(content)
-        elif msg_type == 10000:
-            pass  # system message, keep content
-        elif msg_type == 10002:
-            pass  # revoke message
-        elif msg_type not in (1,):
+        elif msg_type in _V4_KEEP_CONTENT_TYPES:
+            pass  # text / system / revoke message, keep content
+        elif not content.strip() or compression != 0:
             # Unknown non-text type
-            if not content.strip() or compression != 0:
-                return None
+            return None
 
         role = "user" if is_sender else "assistant"
 
-        timestamp = ""
-        if create_time:
-            try:
-                dt = datetime.fromtimestamp(create_time, tz=timezone.utc)
-                timestamp = dt.isoformat()
-            except (ValueError, OSError):
-                pass
-
         return Message(
             role=role,
             content=content,
-            timestamp=timestamp,
+            timestamp=_unix_to_iso(create_time),
             message_id=str(local_id),
             content_type=content_type,
             media=media,
         )
 
     def _read_msg_table_via_cli(self, db_path: Path, raw_key: str) -> Iterator[Conversation]:
-        """读取 MSG 表 (旧版 WeChat 4.x 格式) 通过 CLI"""
-        rows = self._sqlcipher_query(
+        """读取 MSG 表 (旧版 WeChat 4.x 格式) 通过 SQLCipher
+
+        一条查询按 talker 排序取出全部消息, 再按 talker 分组; 不为每个
+        talker 拼接 SQL (避免反复解析/规划, 也不会因 talker 中的引号出错)。
+        """
+        rows = self._sqlcipher_rows(
             db_path, raw_key,
-            "SELECT DISTINCT StrTalker FROM MSG "
-            "WHERE StrTalker IS NOT NULL AND StrTalker != '' ORDER BY StrTalker;"
+            "SELECT MsgSvrID, Type, IsSender, CreateTime, StrContent, "
+            "StrTalker FROM MSG "
+            "WHERE StrTalker IS NOT NULL AND StrTalker != '' "
+            "ORDER BY StrTalker, CreateTime ASC;"
         )
-        if not rows:
+        if rows is None:
             return
 
-        for talker_row in rows:
-            talker = talker_row[0]
-            msg_rows = self._sqlcipher_query(
-                db_path, raw_key,
-                f"SELECT MsgSvrID, Type, SubType, IsSender, CreateTime, "
-                f"StrTalker, StrContent, DisplayContent FROM MSG "
-                f"WHERE StrTalker = '{talker}' ORDER BY CreateTime ASC;"
-            )
-            if not msg_rows:
-                continue
-
+        parse = self._parse_msg_row
+        for talker, talker_rows in itertools.groupby(rows, key=operator.itemgetter(5)):
             messages = []
-            for row in msg_rows:
-                msg = self._parse_msg_row(row)
+            for row in talker_rows:
+                msg = parse(row)
                 if msg:
                     messages.append(msg)
 
@@ -880,12 +1501,15 @@ class WeChatAdapter(BaseAdapter):
             )
 
     def _parse_msg_row(self, row) -> Optional[Message]:
-        """解析 MSG 表的一行 (旧版格式)"""
+        """解析 MSG 表的一行 (旧版格式)
+
+        列顺序: MsgSvrID, Type, IsSender, CreateTime, StrContent[, StrTalker]
+        """
         msg_id = row[0] or ""
         msg_type = int(row[1] or 0)
-        is_sender = int(row[3] or 0)
-        create_time = int(row[4] or 0)
-        content = str(row[6] or "")
+        is_sender = int(row[2] or 0)
+        create_time = int(row[3] or 0)
+        content = str(row[4] or "")
 
         if not content.strip():
             return None
@@ -893,41 +1517,165 @@ class WeChatAdapter(BaseAdapter):
         content_type = "text"
         media: List[MediaRef] = []
 
-        if msg_type == 3:
-            content_type = "image"
-            media = [MediaRef(type="image")]
-        elif msg_type == 34:
-            content_type = "audio"
-            media = [MediaRef(type="voice")]
-        elif msg_type == 43:
-            content_type = "video"
-            media = [MediaRef(type="video")]
+        media_kind = _MSG_MEDIA_TYPES.get(msg_type)
+        if media_kind is not None:
+            content_type, media_type = media_kind
+            media = [MediaRef(type=media_type)]
         elif msg_type == 49:
             content_type = "link"
             content, media = _parse_type49_xml(content)
-        elif msg_type == 10000:
-            pass  # system message
 
         role = "user" if is_sender else "assistant"
 
-        timestamp = ""
-        if create_time:
-            try:
-                dt = datetime.fromtimestamp(create_time, tz=timezone.utc)
-                timestamp = dt.isoformat()
-            except (ValueError, OSError):
-                pass
-
         return Message(
             role=role,
             content=content,
-            timestamp=timestamp,
+            timestamp=_unix_to_iso(create_time),
             message_id=str(msg_id),
             content_type=content_type,
             media=media,
         )
 
 
+def _put_unless_stopped(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """队列满时等待空位, 期间 stop 被设置则放弃; 返回是否已放入"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _tune_read_conn(conn, mmap: bool = False) -> None:
+    """只读提取用的连接参数: 禁止写入、加大页缓存、临时排序放内存
+
+    SQLCipher 加密库的页需逐页解密, 不支持 mmap; 只有明文库才开启。
+    不修改 journal_mode: 对 WAL 库切换日志模式需要写库, 会改动微信的数据文件。
+    """
+    for pragma in _READ_PRAGMAS:
+        conn.execute(pragma)
+    if mmap:
+        conn.execute(f"PRAGMA mmap_size = {READ_MMAP_BYTES}")
+
+
+def _iter_cursor(cursor) -> Iterator[tuple]:
+    """按 cursor.arraysize 分批 fetchmany 逐行产出"""
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            return
+        yield from rows
+
+
+def _iter_cli_rows(output: bytes) -> Iterator[list]:
+    """解析已完整读出的 sqlcipher CLI 输出, 逐行产出列值列表"""
+    return _iter_cli_stream(io.BufferedReader(io.BytesIO(output)))
+
+
+def _iter_cli_stream(stream) -> Iterator[list]:
+    """从 sqlcipher CLI 的输出流 (需支持 peek) 逐行产出列值列表
+
+    .mode json 输出多行 JSON 数组, 前面可能有 PRAGMA 打印的 "ok" 行:
+    跳过这些行, 从 "[" 处开始解析。安装了 ijson 时边读边解析,
+    不构建整个 list-of-dict; 否则整体 json.loads。
+    不是 JSON 时按 "|" 分隔的文本输出解析。
+    """
+    while True:
+        head = stream.peek(1)[:1]
+        if not head:
+            return
+        if head == b"[":
+            yield from _iter_json_rows(stream)
+            return
+        line = stream.readline().strip()
+        if line and line != b"ok" and b"|" in line:
+            yield line.decode("utf-8", errors="replace").split("|")
+
+
+def _iter_json_rows(stream) -> Iterator[list]:
+    """解析 JSON 对象数组, 逐个产出对象的值列表; 输出被截断时保留已解析的行"""
+    if _ijson is not None:
+        try:
+            for row in _ijson.items(stream, "item", use_float=True):
+                yield list(row.values())
+        except (_ijson.JSONError, AttributeError):
+            pass
+        return
+
+    try:
+        parsed = json.loads(stream.read())
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return
+    if isinstance(parsed, list):
+        for row in parsed:
+            if isinstance(row, dict):
+                yield list(row.values())
+
+
+# 每批预解压的行数, 以及值得交给线程池的最少压缩行数
+DECOMPRESS_BATCH_ROWS = 1000
+PARALLEL_DECOMPRESS_MIN = 32
+
+_decompress_pool: Optional[ThreadPoolExecutor] = None
+_decompress_pool_lock = threading.Lock()
+
+
+def _get_decompress_pool() -> ThreadPoolExecutor:
+    """模块级解压线程池 (首次使用时创建)"""
+    global _decompress_pool
+    with _decompress_pool_lock:
+        if _decompress_pool is None:
+            _decompress_pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 4,
+                thread_name_prefix="wechat-zstd",
+            )
+        return _decompress_pool
+
+
+def _iter_decompressed_rows(rows: Iterable) -> Iterator[tuple]:
+    """分批产出消息行, 其中压缩的 BLOB 内容已在线程池中并行解压
+
+    zstd 解压在 C 扩展内释放 GIL, 线程即可并行; 每个线程复用自己的
+    解压上下文。解压成功的行内容替换为文本、压缩标记置 0,
+    失败的行原样产出, 由 _parse_v4_msg_row 按原逻辑处理。
+    """
+    if _zstd is None:
+        yield from rows
+        return
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= DECOMPRESS_BATCH_ROWS:
+            yield from _decompress_batch(batch)
+            batch = []
+    if batch:
+        yield from _decompress_batch(batch)
+
+
+def _decompress_batch(batch: list) -> list:
+    """并行解压一批行中的压缩内容, 原地替换后返回该批"""
+    jobs = [i for i, row in enumerate(batch)
+            if len(row) > 7 and row[7] and isinstance(row[6], bytes)
+            and row[6][:4] == _ZSTD_MAGIC]
+    if len(jobs) < PARALLEL_DECOMPRESS_MIN:
+        return batch
+
+    texts = _get_decompress_pool().map(
+        _decompress_content, [batch[i][6] for i in jobs])
+    for i, text in zip(jobs, texts):
+        if text:
+            row = batch[i]
+            batch[i] = (*row[:6], text, 0, *row[8:])
+    return batch
+
+
+# \w 与 str.isalnum() 加 "_" 在全部 Unicode 码位上等价
+_UNSAFE_ID_CHARS = re.compile(r"[^\w\-]")
+
+
 def _sanitize_id(s: str) -> str:
     """将字符串转为安全的文件名/ID (保留 Unicode 字母和数字)"""
-    return "".join(c if (c.isalnum() or c in "-_") else "_" for c in s)
+    return _UNSAFE_ID_CHARS.sub("_", s)
@@ -4,16 +4,38 @@
 复用用户已登录的 Chrome 会话 (通过 Chrome 扩展 relay)。
 """
 
+import http.client
 import json
+import socket
+import threading
 import time
 import random
-import urllib.request
-import urllib.error
+import urllib.parse
 from typing import Any, Dict, List, Optional
 
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
 
 DEFAULT_BASE_URL = "http://127.0.0.1:18791"
 DEFAULT_PROFILE = "chrome"  # Chrome extension relay profile
+READY_CACHE_SECONDS = 0.5  # is_ready 结果的缓存时长
+
+
+def _dumps(data: dict) -> bytes:
+    """编码请求体 (优先 orjson)"""
+    if _orjson is not None:
+        return _orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def _loads(payload: bytes) -> Any:
+    """解码响应体; evaluate 结果可能有数 MB, orjson 明显更快"""
+    if _orjson is not None:
+        return _orjson.loads(payload)
+    return json.loads(payload.decode("utf-8"))
 
 
 class BrowserError(Exception):
@@ -21,40 +43,117 @@ class BrowserError(Exception):
     pass
 
 
+# scroll_to_bottom 的单轮脚本: 返回文档与内部滚动容器的总高度,
+# 高度与上一轮 (__PREV__) 不同时滚到底
+_SCROLL_TO_BOTTOM_JS = """() => {
+    const scrollable = el => el && el.scrollHeight > el.clientHeight + 1
+        && /auto|scroll|overlay/.test(getComputedStyle(el).overflowY);
+    let inner = document.activeElement;
+    while (inner && inner !== document.body && !scrollable(inner)) inner = inner.parentElement;
+    if (!inner || inner === document.body) {
+        inner = null;
+        for (const el of document.body.querySelectorAll('*')) {
+            if (el.scrollHeight > el.clientHeight + 1
+                    && (!inner || el.scrollHeight > inner.scrollHeight) && scrollable(el)) {
+                inner = el;
+            }
+        }
+    }
+    const doc = document.scrollingElement || document.documentElement;
+    const height = doc.scrollHeight + (inner ? inner.scrollHeight : 0);
+    if (height !== __PREV__) {
+        window.scrollTo(0, doc.scrollHeight);
+        if (inner) inner.scrollTop = inner.scrollHeight;
+    }
+    return height;
+}"""
+
+
 class BrowserClient:
     """OpenClaw 浏览器 HTTP API 客户端"""
 
     def __init__(self, base_url: str = DEFAULT_BASE_URL, profile: str = DEFAULT_PROFILE):
         self.base_url = base_url.rstrip("/")
         self.profile = profile
+        # (monotonic 时间, 结果); check_compatibility 紧接 extract 时省去一次请求
+        self._ready_cache = None
+
+        parts = urllib.parse.urlsplit(self.base_url)
+        self._conn_class = (http.client.HTTPSConnection if parts.scheme == "https"
+                            else http.client.HTTPConnection)
+        self._netloc = parts.netloc
+        self._base_path = parts.path
+        # keep-alive 连接: http.client 连接不能跨线程共享, 每个线程各持一个
+        # (Grok/豆包适配器会在多个线程中并发调用同一个客户端)
+        self._local = threading.local()
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        """当前线程的持久连接 (首次使用时创建)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._conn_class(self._netloc, timeout=timeout)
+        else:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+        return conn
+
+    def _drop_connection(self):
+        """关闭并丢弃当前线程的连接, 下次请求重新建立"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
     def _request(self, method: str, path: str, data: dict = None, timeout: int = 30) -> dict:
-        """发送 HTTP 请求到浏览器服务器"""
-        url = f"{self.base_url}{path}"
+        """发送 HTTP 请求到浏览器服务器 (复用当前线程的 keep-alive 连接)"""
+        url = f"{self._base_path}{path}"
         if "?" in url:
             url += f"&profile={self.profile}"
         else:
             url += f"?profile={self.profile}"
 
-        body = json.dumps(data).encode("utf-8") if data else None
-        req = urllib.request.Request(
-            url,
-            data=body,
-            method=method,
-            headers={"Content-Type": "application/json"} if body else {},
-        )
-
-        try:
-            with urllib.request.urlopen(req, timeout=timeout) as resp:
-                return json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            raise BrowserError(f"HTTP {e.code}: {body}")
-        except urllib.error.URLError as e:
+        body = _dumps(data) if data else None
+        headers = {"Content-Type": "application/json"} if body else {}
+
+        # 复用的连接可能已被服务器关闭: 重连后重试一次。POST (/act 等) 不是幂等的,
+        # 请求一旦发出, 服务器可能已执行了动作, 只有发送时就失败才重试
+        for attempt in range(2):
+            conn = self._connection(timeout)
+            reused = conn.sock is not None
+            sent = False
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                sent = True
+                resp = conn.getresponse()
+                payload = resp.read()
+                break
+            except socket.timeout as e:
+                # 网关未在超时内接受连接或响应: 与连接失败一样报告
+                self._drop_connection()
+                raise self._connect_error(e)
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError) as e:
+                self._drop_connection()
+                if reused and attempt == 0 and (method == "GET" or not sent):
+                    continue
+                raise self._connect_error(e)
+            except (http.client.HTTPException, OSError) as e:
+                self._drop_connection()
+                raise self._connect_error(e)
+
+        if resp.will_close:
+            self._drop_connection()
+        if resp.status >= 400:
             raise BrowserError(
-                f"无法连接浏览器服务器 {self.base_url}: {e.reason}\n"
-                "请确保 OpenClaw 网关已启动 (openclaw gateway start)"
-            )
+                f"HTTP {resp.status}: {payload.decode('utf-8', errors='replace')}")
+        return _loads(payload)
+
+    def _connect_error(self, e: Exception) -> "BrowserError":
+        return BrowserError(
+            f"无法连接浏览器服务器 {self.base_url}: {e}\n"
+            "请确保 OpenClaw 网关已启动 (openclaw gateway start)"
+        )
 
     # --- 状态 ---
 
@@ -63,12 +162,18 @@ class BrowserClient:
         return self._request("GET", "/")
 
     def is_ready(self) -> bool:
-        """检查浏览器是否就绪"""
+        """检查浏览器是否就绪 (结果缓存 READY_CACHE_SECONDS 秒)"""
+        now = time.monotonic()
+        cached = self._ready_cache
+        if cached is not None and now - cached[0] < READY_CACHE_SECONDS:
+            return cached[1]
+
         try:
-            s = self.status()
-            return s.get("running", False)
+            ready = self.status().get("running", False)
         except BrowserError:
-            return False
+            ready = False
+        self._ready_cache = (now, ready)
+        return ready
 
     # --- 标签页管理 ---
 
@@ -163,23 +268,65 @@ class BrowserClient:
         """模拟人类操作延迟"""
         time.sleep(random.uniform(min_sec, max_sec))
 
+    def wait_ready(self, target_id: str, predicate_js: str, idle_ms: int = 300,
+                   timeout_ms: int = 10000, poll_ms: int = 100) -> bool:
+        """轮询等待页面就绪, 替代 networkidle
+
+        就绪条件: predicate_js (JS 表达式) 为真, 且最近 idle_ms 内没有新的
+        资源请求完成。networkidle 在有长轮询/广告的页面上迟迟不触发,
+        而这里只要关键 DOM 出现并短暂静默即可返回。
+
+        Returns:
+            True 如果在超时前就绪, 否则 False (调用方可继续尝试提取)
+        """
+        script = (
+            "() => {"
+            "  const idle = window.__khIdle || (window.__khIdle = { last: performance.now() });"
+            "  if (!idle.observer) {"
+            "    idle.observer = new PerformanceObserver(() => { idle.last = performance.now(); });"
+            "    idle.observer.observe({ type: 'resource' });"
+            "  }"
+            "  const entries = performance.getEntriesByType('resource');"
+            "  const lastEnd = entries.length ? entries[entries.length - 1].responseEnd : 0;"
+            f"  return {{ ready: !!({predicate_js}),"
+            "           idleMs: performance.now() - Math.max(idle.last, lastEnd) };"
+            "}"
+        )
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            try:
+                state = self.evaluate(script, target_id).get("result") or {}
+            except BrowserError:
+                state = {}
+            if state.get("ready") and state.get("idleMs", 0) >= idle_ms:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_ms / 1000)
+
     def scroll_page_down(self, target_id: str):
         """向下滚动一页"""
         self.press_key("PageDown", target_id)
 
     def scroll_to_bottom(self, target_id: str, max_scrolls: int = 50):
-        """滚动到底部, 返回滚动次数"""
-        for i in range(max_scrolls):
-            prev_height = self.evaluate(
-                "() => document.documentElement.scrollHeight", target_id
-            )
-            self.press_key("End", target_id)
+        """滚动到底部, 返回滚动次数
+
+        每轮只发一次 evaluate: 读出当前高度, 与上一轮相同说明没有加载出
+        新内容 (已到底), 否则滚到底。与按 End 键一样, 同时滚动文档和
+        焦点所在 (没有焦点时为最高的) 可滚动容器 — 单页应用的聊天记录
+        通常在内部容器中滚动。
+        """
+        prev_height = None
+        scrolls = 0
+        while scrolls < max_scrolls:
+            script = _SCROLL_TO_BOTTOM_JS.replace(
+                "__PREV__", "null" if prev_height is None else str(int(prev_height)))
+            height = self.evaluate(script, target_id).get("result")
+            if height == prev_height:
+                return scrolls
+            scrolls += 1
+            prev_height = height
             self.human_delay(0.5, 1.5)
-            new_height = self.evaluate(
-                "() => document.documentElement.scrollHeight", target_id
-            )
-            if prev_height == new_height:
-                return i + 1
         return max_scrolls
 
     def scroll_to_top(self, target_id: str):
@@ -16,15 +16,33 @@ class Config:
     # 媒体文件目录名
     media_dir: str = "media"
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # 目录相关字段变化 (如 CLI 的 --output) 时丢弃缓存的路径
+        if name in _PATH_FIELDS:
+            self.__dict__.pop("_path_cache", None)
+
+    def _paths(self) -> dict:
+        """缓存的 Path 对象: 每个对话都会用到平台目录, 避免反复拼接"""
+        return self.__dict__.setdefault("_path_cache", {})
+
     @property
     def output_dir(self) -> Path:
-        return self.project_root / self.output_root
+        paths = self._paths()
+        path = paths.get(None)
+        if path is None:
+            path = paths[None] = self.project_root / self.output_root
+        return path
 
     def platform_dir(self, platform: str) -> Path:
-        return self.output_dir / platform
+        paths = self._paths()
+        path = paths.get(platform)
+        if path is None:
+            path = paths[platform] = self.output_dir / platform
+        return path
 
     def platform_media_dir(self, platform: str, conversation_id: str) -> Path:
-        return self.output_dir / platform / self.media_dir / conversation_id
+        return self.platform_dir(platform) / self.media_dir / conversation_id
 
     def conversation_path(self, platform: str, conversation_id: str) -> Path:
         return self.platform_dir(platform) / f"{conversation_id}.jsonl"
@@ -35,3 +53,11 @@ class Config:
     def state_path(self, platform: str) -> Path:
         """增量提取状态文件"""
         return self.platform_dir(platform) / "state.json"
+
+    def search_index_path(self, platform: str) -> Path:
+        """全文搜索索引 (SQLite FTS5)"""
+        return self.platform_dir(platform) / "search_index.db"
+
+
+# 影响输出路径的字段
+_PATH_FIELDS = frozenset({"project_root", "output_root", "media_dir"})
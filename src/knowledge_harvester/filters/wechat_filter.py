@@ -8,10 +8,21 @@ Evaluates filter policies to classify conversations into tiers:
 
 import json
 import logging
+import time
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 log = logging.getLogger(__name__)
 
@@ -23,6 +34,9 @@ class FilterRule:
     tier: str  # "keep" | "archive" | "exclude"
     priority: int = 10
     reason: str = ""
+    # Compiled from `match` on first use; see _compile_rule
+    _predicate: Optional[Callable[[dict, float], bool]] = field(
+        default=None, init=False, repr=False, compare=False)
 
     def to_dict(self) -> dict:
         d = {"name": self.name, "match": self.match, "tier": self.tier, "priority": self.priority}
@@ -30,6 +44,12 @@ class FilterRule:
             d["reason"] = self.reason
         return d
 
+    def predicate(self) -> Callable[[dict, float], bool]:
+        """Return the compiled matcher for this rule (built once, then cached)."""
+        if self._predicate is None:
+            self._predicate = _compile_rule(self.match)
+        return self._predicate
+
 
 @dataclass
 class FilterPolicy:
@@ -37,6 +57,25 @@ class FilterPolicy:
     default_tier: str = "archive"
     rules: List[FilterRule] = field(default_factory=list)
 
+    # Rules by descending priority, built on first evaluate(); see _by_priority
+    _ordered: Optional[List[FilterRule]] = field(
+        default=None, init=False, repr=False, compare=False)
+
+    def add_rules(self, rules: List[FilterRule]):
+        """Append rules (declaration order is kept for save())."""
+        self.rules.extend(rules)
+        self._ordered = None
+
+    def _by_priority(self) -> List[FilterRule]:
+        """Rules sorted by descending priority so evaluate() can stop at the
+        first match. The sort is stable: ties resolve to the rule declared
+        first. Rebuilt when rules are added (add_rules, or a length change
+        from appending to `rules` directly)."""
+        ordered = self._ordered
+        if ordered is None or len(ordered) != len(self.rules):
+            ordered = self._ordered = sorted(self.rules, key=lambda r: -r.priority)
+        return ordered
+
     @classmethod
     def load(cls, path: str) -> "FilterPolicy":
         data = json.loads(Path(path).read_text(encoding="utf-8"))
@@ -53,84 +92,123 @@ class FilterPolicy:
             "default_tier": self.default_tier,
             "rules": [r.to_dict() for r in self.rules],
         }
-        Path(path).write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        if orjson is not None:
+            Path(path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            Path(path).write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
 
     def evaluate(self, meta: dict) -> Tuple[str, str]:
         """Evaluate a conversation against all rules.
 
-        Returns (tier, matched_rule_name).
-        """
-        matched_tier = self.default_tier
-        matched_rule = "default"
-        matched_priority = -1
-
-        for rule in self.rules:
-            if rule.priority > matched_priority and _matches(rule, meta):
-                matched_tier = rule.tier
-                matched_rule = rule.name
-                matched_priority = rule.priority
-
-        return matched_tier, matched_rule
+        Rules are sorted by descending priority, so the first match is the
+        highest-priority one (ties go to the first-declared rule).
 
+        The clock is read and last_message_time parsed once per call, not
+        per rule.
 
-def _matches(rule: FilterRule, meta: dict) -> bool:
-    """Check if a conversation matches a rule's criteria."""
-    match = rule.match
+        Returns (tier, matched_rule_name).
+        """
+        now = time.time()
+        if "last_ts" not in meta:
+            meta = dict(meta, last_ts=_iso_to_ts(meta.get("last_message_time", "")))
+        for rule in self._by_priority():
+            if rule.predicate()(meta, now):
+                return rule.tier, rule.name
+        return self.default_tier, "default"
+
+
+def _parse_iso(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp, using ciso8601 (C parser) when installed."""
+    if ciso8601 is not None:
+        return ciso8601.parse_datetime(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _iso_to_ts(value: str) -> float:
+    """ISO 8601 timestamp → Unix seconds; 0 when empty or unparseable.
+
+    Timestamps without an offset are taken as UTC (the adapters always
+    write UTC).
+    """
+    if not value:
+        return 0
+    try:
+        dt = _parse_iso(value)
+    except (ValueError, TypeError):
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _last_ts(meta: dict) -> float:
+    """The conversation's last message time in Unix seconds (0 if unknown)."""
+    ts = meta.get("last_ts")
+    if ts is None:
+        return _iso_to_ts(meta.get("last_message_time", ""))
+    return ts
+
+
+def _compile_rule(match: Dict[str, Any]) -> Callable[[dict, float], bool]:
+    """Build a matcher that only checks the criteria present in `match`.
+
+    Criteria are resolved once here (key lookups, list → set, days →
+    seconds) instead of on every conversation. Each clause is a closure
+    taking (meta, now) with `now` in Unix seconds; the matcher ANDs them
+    in the same order as the criteria are documented.
+    """
+    clauses = []
 
     if "is_group" in match:
-        if meta.get("is_group") != match["is_group"]:
-            return False
+        is_group = match["is_group"]
+        clauses.append(lambda meta, now: meta.get("is_group") == is_group)
 
     if "username" in match:
         usernames = match["username"]
         if isinstance(usernames, str):
             usernames = [usernames]
-        if meta.get("username") not in usernames:
-            return False
+        usernames = frozenset(usernames)
+        clauses.append(lambda meta, now: meta.get("username") in usernames)
 
     if "title_contains" in match:
-        title = meta.get("title", "")
-        if not any(kw in title for kw in match["title_contains"]):
-            return False
+        keywords = tuple(match["title_contains"])
+        clauses.append(lambda meta, now: any(kw in meta.get("title", "") for kw in keywords))
 
     if "title_not_contains" in match:
-        title = meta.get("title", "")
-        if any(kw in title for kw in match["title_not_contains"]):
-            return False
+        banned = tuple(match["title_not_contains"])
+        clauses.append(lambda meta, now: not any(kw in meta.get("title", "") for kw in banned))
 
     if "min_messages" in match:
-        if meta.get("message_count", 0) < match["min_messages"]:
-            return False
+        min_messages = match["min_messages"]
+        clauses.append(lambda meta, now: meta.get("message_count", 0) >= min_messages)
 
     if "max_messages" in match:
-        if meta.get("message_count", 0) > match["max_messages"]:
-            return False
+        max_messages = match["max_messages"]
+        clauses.append(lambda meta, now: meta.get("message_count", 0) <= max_messages)
 
+    # A missing or invalid last_message_time gives last_ts 0: never
+    # active, always dormant
     if "active_within_days" in match:
-        last = meta.get("last_message_time", "")
-        if last:
-            try:
-                cutoff = datetime.now(timezone.utc) - timedelta(days=match["active_within_days"])
-                last_dt = datetime.fromisoformat(last.replace("Z", "+00:00"))
-                if last_dt < cutoff:
-                    return False
-            except (ValueError, TypeError):
-                return False
-        else:
-            return False
+        active_window = match["active_within_days"] * 86400
+        clauses.append(lambda meta, now: _last_ts(meta) >= now - active_window)
 
     if "dormant_days" in match:
-        last = meta.get("last_message_time", "")
-        if last:
-            try:
-                cutoff = datetime.now(timezone.utc) - timedelta(days=match["dormant_days"])
-                last_dt = datetime.fromisoformat(last.replace("Z", "+00:00"))
-                if last_dt >= cutoff:
-                    return False
-            except (ValueError, TypeError):
-                pass
+        dormant_window = match["dormant_days"] * 86400
+        clauses.append(lambda meta, now: _last_ts(meta) < now - dormant_window)
+
+    if not clauses:
+        return lambda meta, now: True
+    if len(clauses) == 1:
+        return clauses[0]
+    clauses = tuple(clauses)
+    return lambda meta, now: all(clause(meta, now) for clause in clauses)
+
 
-    return True
+def _matches(rule: FilterRule, meta: dict, now: Optional[float] = None) -> bool:
+    """Check if a conversation matches a rule's criteria (`now` in Unix seconds)."""
+    if now is None:
+        now = time.time()
+    return rule.predicate()(meta, now)
 
 
 def build_conversation_meta(conv_entry: dict) -> dict:
@@ -143,4 +221,5 @@ def build_conversation_meta(conv_entry: dict) -> dict:
         "is_group": metadata.get("is_group", False),
         "username": metadata.get("username", ""),
         "last_message_time": metadata.get("last_message_time", ""),
+        "last_ts": _iso_to_ts(metadata.get("last_message_time", "")),
     }
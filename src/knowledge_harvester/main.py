@@ -1,14 +1,16 @@
 """CLI 入口 - 知识收割机"""
 
 import argparse
+import logging
 import sys
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent.parent))
+# 直接运行本文件时才需要把 src/ 加入路径 (python -m 已可导入包)
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from knowledge_harvester.config import Config
 from knowledge_harvester.storage import Storage
-from knowledge_harvester.adapters.chatgpt import ChatGPTAdapter
 
 
 def _get_config(args) -> Config:
@@ -31,10 +33,11 @@ def _run_extraction(storage, adapter, platform, source="", incremental=False,
             print()
 
     state = storage.load_state(platform) if incremental else {"last_run": "", "conversations": {}}
-    known_ids = set(state.get("conversations", {}).keys()) if incremental else set()
+    # 已知对话的签名索引只建一次, 循环中直接比较, 不再逐段重读状态文件
+    known = storage.state_signatures(state) if incremental else {}
 
     if incremental:
-        print(f"增量模式: 已知 {len(known_ids)} 段对话")
+        print(f"增量模式: 已知 {len(known)} 段对话")
         if state.get("last_run"):
             print(f"上次提取: {state['last_run']}")
 
@@ -44,32 +47,42 @@ def _run_extraction(storage, adapter, platform, source="", incremental=False,
     count = 0
     skipped = 0
     filtered = 0
-    for conversation in adapter.extract(source):
-        if incremental and not storage.is_conversation_changed(platform, conversation):
-            skipped += 1
-            continue
+    # 增量模式下每段对话追加一行状态日志, 结束时由 save_state 合并
+    journal = storage.open_state_journal(platform) if incremental else None
+    try:
+        # 批量保存: index.json 定时写盘, 不再每段对话整体重写一次
+        with storage.batch():
+            for conversation in adapter.extract(source):
+                if incremental and known.get(conversation.id) == storage.conversation_signature(conversation):
+                    skipped += 1
+                    continue
 
-        # Apply filter policy if provided
-        if filter_policy:
-            meta = {
-                "is_group": conversation.metadata.get("is_group", False),
-                "username": conversation.metadata.get("username", ""),
-                "title": conversation.title,
-                "message_count": conversation.message_count,
-                "last_message_time": conversation.metadata.get("last_message_time", ""),
-            }
-            tier, rule = filter_policy.evaluate(meta)
-            conversation.metadata["tier"] = tier
-            conversation.metadata["filter_rule"] = rule
-
-            if tier == "exclude":
-                filtered += 1
-                continue
-
-        storage.save_conversation(conversation)
-        storage.update_state_for_conversation(state, conversation)
-        count += 1
-        print(f"  ✓ [{count}] {conversation.title[:50]} ({conversation.message_count} msgs)")
+                # Apply filter policy if provided
+                if filter_policy:
+                    meta = {
+                        "is_group": conversation.metadata.get("is_group", False),
+                        "username": conversation.metadata.get("username", ""),
+                        "title": conversation.title,
+                        "message_count": conversation.message_count,
+                        "last_message_time": conversation.metadata.get("last_message_time", ""),
+                    }
+                    tier, rule = filter_policy.evaluate(meta)
+                    conversation.metadata["tier"] = tier
+                    conversation.metadata["filter_rule"] = rule
+
+                    if tier == "exclude":
+                        filtered += 1
+                        continue
+
+                storage.save_conversation(conversation)
+                if incremental:
+                    storage.update_state_for_conversation(state, conversation, journal)
+                count += 1
+                print(f"  ✓ [{count}] {conversation.title[:50]} ({conversation.message_count} msgs)")
+    finally:
+        if journal is not None:
+            journal.close()
+        storage.close()
 
     if incremental:
         storage.save_state(platform, state)
@@ -86,6 +99,8 @@ def _run_extraction(storage, adapter, platform, source="", incremental=False,
 
 def cmd_import_chatgpt(args):
     """导入 ChatGPT 导出数据"""
+    from knowledge_harvester.adapters.chatgpt import ChatGPTAdapter
+
     config = _get_config(args)
     storage = Storage(config)
     adapter = ChatGPTAdapter()
@@ -187,7 +202,7 @@ def cmd_extract_wechat(args):
 
     if policy_path:
         filter_policy = FilterPolicy.load(policy_path)
-        filter_policy.rules.extend(cli_rules)
+        filter_policy.add_rules(cli_rules)
     elif cli_rules:
         filter_policy = FilterPolicy(rules=cli_rules)
 
@@ -252,7 +267,11 @@ def cmd_list(args):
 
 def cmd_view(args):
     """查看完整对话"""
-    import json as _json
+    # 逐行解码 JSONL: 优先 orjson (直接接受 bytes), 回退标准库 json
+    try:
+        from orjson import loads as _loads
+    except ImportError:
+        from json import loads as _loads
     config = _get_config(args)
     storage = Storage(config)
 
@@ -302,14 +321,12 @@ def cmd_view(args):
             continue
 
         shown = 0
-        with open(path, "r", encoding="utf-8") as f:
+        with open(path, "rb") as f:
             for line in f:
-                line = line.strip()
-                if not line:
-                    continue
+                # 空行和损坏的行都解码失败, 直接跳过 (两种 JSONDecodeError 都是 ValueError)
                 try:
-                    data = _json.loads(line)
-                except _json.JSONDecodeError:
+                    data = _loads(line)
+                except ValueError:
                     continue
 
                 role = data.get("role", "?")
@@ -503,6 +520,14 @@ def main():
     # stats
     subparsers.add_parser("stats", help="显示统计信息")
 
+    # 安装了 argcomplete 时支持 Tab 补全 (补全请求在此处直接退出)
+    try:
+        import argcomplete
+    except ImportError:
+        pass
+    else:
+        argcomplete.autocomplete(parser)
+
     args = parser.parse_args()
 
     commands = {
@@ -517,6 +542,15 @@ def main():
         "wechat-manage": cmd_wechat_manage,
     }
 
+    # 适配器的进度/错误信息走 logging (多线程提取时不会交错), 按原样输出到 stdout,
+    # 与 print 共用同一缓冲区, 顺序不变; 只配置本包的 logger, 不影响其它库
+    log_handler = logging.StreamHandler(sys.stdout)
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    package_log = logging.getLogger("knowledge_harvester")
+    package_log.addHandler(log_handler)
+    package_log.setLevel(logging.INFO)
+    package_log.propagate = False
+
     handler = commands.get(args.command)
     if handler:
         handler(args)
@@ -3,11 +3,16 @@
 遵循 specs/03_personal-knowledge-extraction 定义的统一 schema。
 """
 
+import sys
 from dataclasses import dataclass, field
 from typing import Any, Dict, List
 
+# 大量 Message/MediaRef 实例: 使用 __slots__ 省去每个实例的 __dict__
+# (dataclass slots 参数需要 Python 3.10+, 旧版本退回普通 dataclass)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(**_SLOTS)
 class MediaRef:
     """媒体引用 (图片、文件、语音、链接等)"""
     type: str           # "image" | "file" | "voice" | "link" | "video" | "mini_program"
@@ -19,6 +24,26 @@ class MediaRef:
     summary: str = ""       # AI 生成的内容摘要 (Tier 2, 后续填充)
 
 
+def _media_ref_from_dict(d: Dict[str, Any]) -> MediaRef:
+    """dict → MediaRef (缺省字段取默认值, 未知字段忽略)"""
+    try:
+        # 常见情况: 键都是 MediaRef 字段, 直接按关键字参数构造
+        ref = MediaRef(**d)
+    except TypeError:
+        ref = MediaRef(
+            type=d["type"],
+            path=d.get("path", ""),
+            original_url=d.get("original_url", ""),
+            filename=d.get("filename", ""),
+            size_bytes=d.get("size_bytes", 0),
+            description=d.get("description", ""),
+            summary=d.get("summary", ""),
+        )
+    # 取值只有几种, 驻留后所有实例共享同一个字符串对象
+    ref.type = sys.intern(ref.type)
+    return ref
+
+
 def _media_ref_to_dict(m: MediaRef) -> Dict[str, Any]:
     """MediaRef → dict, 省略空字段 (sparse serialization)"""
     d: Dict[str, Any] = {"type": m.type}
@@ -37,7 +62,7 @@ def _media_ref_to_dict(m: MediaRef) -> Dict[str, Any]:
     return d
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Message:
     """单条消息"""
     role: str               # "user" | "assistant" | "system" | "tool"
@@ -63,29 +88,20 @@ class Message:
 
     @classmethod
     def from_dict(cls, d: Dict[str, Any]) -> "Message":
-        media = [
-            MediaRef(
-                type=m["type"],
-                path=m.get("path", ""),
-                original_url=m.get("original_url", ""),
-                filename=m.get("filename", ""),
-                size_bytes=m.get("size_bytes", 0),
-                description=m.get("description", ""),
-                summary=m.get("summary", ""),
-            )
-            for m in d.get("media", [])
-        ]
+        media_dicts = d.get("media")
+        media = [_media_ref_from_dict(m) for m in media_dicts] if media_dicts else []
+        # role / content_type 取值只有几种: 驻留, 不为每条消息各留一份副本
         return cls(
-            role=d["role"],
+            role=sys.intern(d["role"]),
             content=d["content"],
             timestamp=d.get("timestamp", ""),
             message_id=d.get("message_id", ""),
-            content_type=d.get("content_type", "text"),
+            content_type=sys.intern(d.get("content_type", "text")),
             media=media,
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Conversation:
     """一段对话"""
     id: str
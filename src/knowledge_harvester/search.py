@@ -1,12 +1,27 @@
 """全文搜索 - 跨平台对话搜索"""
 
-import json
+import itertools
+import mmap
+import os
 import re
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
 
 from .config import Config
 from .models import Message
+from .search_index import SearchIndex, searchable_text
+
+# 候选对话不少于此数时才用线程池并行扫描; 以及最多线程数
+PARALLEL_SEARCH_MIN = 16
+SEARCH_WORKERS = 8
 
 
 class SearchResult:
@@ -27,6 +42,8 @@ class SearchEngine:
 
     def __init__(self, config: Config = None):
         self.config = config or Config()
+        # platform → ((index.json 的 mtime_ns, 大小), 解析后的索引); 文件变化后重新读取
+        self._index_cache: Dict[str, Tuple[Tuple[int, int], List[dict]]] = {}
 
     def search(self, query: str, platform: str = None,
                max_results: int = 50) -> List[SearchResult]:
@@ -37,6 +54,11 @@ class SearchEngine:
             platform: 限定搜索的平台 (None = 搜索所有)
             max_results: 最大返回结果数
         """
+        return self._search(query, platform, max_results)
+
+    def _search(self, query: str, platform: str = None, max_results: int = 50,
+                accept: Optional[Callable[[dict], bool]] = None) -> List[SearchResult]:
+        """search 的实现; accept 对每条消息 (JSONL 中的 dict) 先做筛选"""
         keywords = query.lower().split()
         if not keywords:
             return []
@@ -46,10 +68,13 @@ class SearchEngine:
 
         for plat in platforms:
             index = self._load_index(plat)
-            for entry in index:
-                conv_id = entry["id"]
-                title = entry.get("title", "")
-                hits = self._search_conversation(plat, conv_id, title, keywords)
+            candidates = self._candidates(plat, keywords, index)
+            work = [
+                (entry["id"], entry.get("title", ""))
+                for entry in index
+                if candidates is None or entry["id"] in candidates
+            ]
+            for hits in self._scan(plat, work, keywords, accept):
                 results.extend(hits)
 
                 if len(results) >= max_results * 3:
@@ -61,10 +86,9 @@ class SearchEngine:
 
     def search_by_role(self, query: str, role: str,
                        platform: str = None, max_results: int = 50) -> List[SearchResult]:
-        """按角色过滤搜索"""
-        results = self.search(query, platform, max_results * 2)
-        filtered = [r for r in results if r.message.role == role]
-        return filtered[:max_results]
+        """按角色过滤搜索 (扫描时即按角色筛选)"""
+        return self._search(query, platform, max_results,
+                            accept=lambda data: data.get("role") == role)
 
     def search_recent(self, query: str, days: int = 30,
                       platform: str = None, max_results: int = 50) -> List[SearchResult]:
@@ -72,18 +96,15 @@ class SearchEngine:
         from datetime import datetime, timedelta, timezone
         cutoff = (datetime.now(tz=timezone.utc) - timedelta(days=days)).isoformat()
 
-        results = self.search(query, platform, max_results * 2)
-        filtered = [r for r in results if r.message.timestamp >= cutoff]
-        return filtered[:max_results]
+        return self._search(query, platform, max_results,
+                            accept=lambda data: data.get("timestamp", "") >= cutoff)
 
     def list_all(self, platform: str = None) -> List[Dict[str, Any]]:
         """列出所有对话的索引信息"""
         all_entries = []
         for plat in self._get_platforms(platform):
-            index = self._load_index(plat)
-            for entry in index:
-                entry["platform"] = plat
-                all_entries.append(entry)
+            # 索引被缓存, 不修改原条目
+            all_entries.extend(dict(entry, platform=plat) for entry in self._load_index(plat))
         return all_entries
 
     def stats(self) -> Dict[str, Any]:
@@ -120,16 +141,75 @@ class SearchEngine:
         )
 
     def _load_index(self, platform: str) -> List[dict]:
-        """加载平台索引"""
+        """加载平台索引 (按 mtime 缓存, 同一进程内多次查询不重复解析)"""
         index_path = self.config.index_path(platform)
-        if not index_path.exists():
+        try:
+            st = index_path.stat()
+        except OSError:
             return []
-        with open(index_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        version = (st.st_mtime_ns, st.st_size)
+        cached = self._index_cache.get(platform)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(index_path, "rb") as f:
+            index = _loads(f.read())
+        self._index_cache[platform] = (version, index)
+        return index
+
+    def _scan(self, platform: str, work: List[Tuple[str, str]], keywords: List[str],
+              accept: Optional[Callable[[dict], bool]]) -> Iterator[List[SearchResult]]:
+        """按 work 顺序产出每段对话 (conv_id, title) 的命中结果
+
+        对话较多时用线程池并行读文件和解析, 同时在处理中的对话不超过
+        线程数的两倍; 结果仍按顺序产出, 调用方提前停止时取消其余任务。
+        """
+        def scan_one(item: Tuple[str, str]) -> List[SearchResult]:
+            conv_id, title = item
+            return self._search_conversation(platform, conv_id, title, keywords, accept)
+
+        if len(work) < PARALLEL_SEARCH_MIN:
+            yield from map(scan_one, work)
+            return
+
+        workers = min(SEARCH_WORKERS, (os.cpu_count() or 4) * 2)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        remaining = iter(work)
+        pending = deque(
+            pool.submit(scan_one, item)
+            for item in itertools.islice(remaining, workers * 2)
+        )
+        try:
+            while pending:
+                hits = pending.popleft().result()
+                item = next(remaining, None)
+                if item is not None:
+                    pending.append(pool.submit(scan_one, item))
+                yield hits
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _candidates(self, platform: str, keywords: List[str],
+                    index: List[dict]) -> Optional[Set[str]]:
+        """用搜索索引筛出可能命中的对话 ID; 没有可用索引时返回 None (逐个扫描)"""
+        search_index = SearchIndex.open(self.config.search_index_path(platform))
+        if search_index is None:
+            return None
+        conv_paths = {
+            entry["id"]: self.config.conversation_path(platform, entry["id"])
+            for entry in index
+        }
+        try:
+            return search_index.candidates(keywords, conv_paths)
+        except sqlite3.Error:
+            return None
+        finally:
+            search_index.close()
 
     def _search_conversation(self, platform: str, conv_id: str,
-                             title: str, keywords: List[str]) -> List[SearchResult]:
-        """搜索单段对话"""
+                             title: str, keywords: List[str],
+                             accept: Optional[Callable[[dict], bool]] = None,
+                             ) -> List[SearchResult]:
+        """搜索单段对话 (accept 不为 None 时只考虑它接受的消息)"""
         conv_path = self.config.conversation_path(platform, conv_id)
         if not conv_path.exists():
             return []
@@ -139,42 +219,161 @@ class SearchEngine:
         # 标题匹配加分
         title_bonus = 0.5 if all(kw in title.lower() for kw in keywords) else 0.0
 
-        with open(conv_path, "r", encoding="utf-8") as f:
-            for line_num, line in enumerate(f):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                content_lower = data.get("content", "").lower()
-
-                # 也搜索媒体文件名和描述
-                media_text = ""
-                for m in data.get("media", []):
-                    fn = m.get("filename", "")
-                    desc = m.get("description", "")
-                    if fn:
-                        media_text += " " + fn
-                    if desc:
-                        media_text += " " + desc
-                media_lower = media_text.lower()
-                searchable = content_lower + media_lower
-
-                if all(kw in searchable for kw in keywords):
-                    msg = Message.from_dict(data)
-                    # 计算简单相关度分数
-                    score = sum(searchable.count(kw) for kw in keywords)
-                    score = min(score / 10.0, 1.0) + title_bonus
-
-                    results.append(SearchResult(
-                        platform=platform,
-                        conversation_id=conv_id,
-                        title=title,
-                        message=msg,
-                        score=score,
-                    ))
+        # 无大小写之分的关键词可先在原始字节行里查找, ASCII 关键词在
+        # bytes.lower() 后的行里查找; 不含则不必解析 JSON 和 str.lower()
+        raw_keywords = _raw_keywords(keywords)
+        ascii_keywords = _ascii_keywords(keywords)
+
+        with open(conv_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = list(_candidate_lines(mm, raw_keywords, ascii_keywords))
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = _loads(line)
+            except ValueError:  # json.JSONDecodeError / orjson.JSONDecodeError
+                continue
+
+            if accept is not None and not accept(data):
+                continue
+
+            # 内容以及媒体文件名和描述 (与搜索索引中的文本一致)
+            searchable = searchable_text(data)
+
+            # 每个关键词只扫描一次: 出现次数既用于判断是否全部命中,
+            # 也用于计分; 有一个未出现就停止
+            occurrences = _count_all(searchable, keywords)
+            if occurrences:
+                msg = Message.from_dict(data)
+                # 计算简单相关度分数
+                score = min(occurrences / 10.0, 1.0) + title_bonus
+
+                results.append(SearchResult(
+                    platform=platform,
+                    conversation_id=conv_id,
+                    title=title,
+                    message=msg,
+                    score=score,
+                ))
 
         return results
+
+
+def _candidate_lines(mm: mmap.mmap, raw_keywords: List[bytes],
+                     ascii_keywords: List[bytes]) -> Iterator[bytes]:
+    """产出文件中可能命中关键词的行 (原始字节), 其余行不必解析
+
+    有可预筛的关键词时先在整个文件里查找, 有关键词不出现则一行也不产出;
+    否则只取出包含最长关键词命中位置的行, 再检查其余关键词。
+    预筛不通过的行只有含 \\u 转义 (非本程序写出) 或小写后变成 ASCII 字母
+    的字符时才可能命中; 先对整个文件检查一次, 多数文件不必逐行检查。
+    """
+    maybe_escaped = mm.find(b"\\u") != -1
+    maybe_special = bool(ascii_keywords) and (maybe_escaped or any(
+        mm.find(ch) != -1 for ch in _LOWER_TO_ASCII_UTF8))
+
+    def passes(line: bytes) -> bool:
+        if (raw_keywords and not _contains_all(line, raw_keywords)
+                and not (maybe_escaped and b"\\u" in line)):
+            return False
+        if (ascii_keywords and not _contains_all(line.lower(), ascii_keywords)
+                and not (maybe_special and (b"\\u" in line
+                                            or _contains_any(line, _LOWER_TO_ASCII_UTF8)))):
+            return False
+        return True
+
+    folded = None
+    if ascii_keywords and not maybe_special:
+        # bytes.lower() 不改变长度, 偏移与原文一致
+        folded = mm[:].lower()
+        if not _contains_all(folded, ascii_keywords):
+            return
+    if raw_keywords and not maybe_escaped:
+        if any(mm.find(kw) == -1 for kw in raw_keywords):
+            return
+        haystack, anchor = mm, max(raw_keywords, key=len)
+    elif folded is not None:
+        haystack, anchor = folded, max(ascii_keywords, key=len)
+    else:
+        yield from filter(passes, iter(mm.readline, b""))
+        return
+
+    pos = haystack.find(anchor)
+    while pos != -1:
+        start = haystack.rfind(b"\n", 0, pos) + 1
+        end = haystack.find(b"\n", pos)
+        if end == -1:
+            end = len(mm)
+        line = mm[start:end]
+        if passes(line):
+            yield line
+        pos = haystack.find(anchor, end)
+
+
+def _contains_all(line: bytes, needles: List[bytes]) -> bool:
+    """line 是否包含全部 needles"""
+    for needle in needles:
+        if needle not in line:
+            return False
+    return True
+
+
+def _contains_any(line: bytes, needles: Tuple[bytes, ...]) -> bool:
+    """line 是否包含任一 needle"""
+    for needle in needles:
+        if needle in line:
+            return True
+    return False
+
+
+def _count_all(text: str, keywords: List[str]) -> int:
+    """全部关键词在 text 中的出现次数之和; 任一关键词未出现时返回 0"""
+    total = 0
+    for kw in keywords:
+        n = text.count(kw)
+        if not n:
+            return 0
+        total += n
+    return total
+
+
+# 小写后含 ASCII 字母的非 ASCII 字符 (İ → i̇, 开尔文符号 K → k) 的 UTF-8 编码;
+# bytes.lower() 只转换 A-Z, 含这些字符的行不能用 ASCII 关键词预筛
+_LOWER_TO_ASCII_UTF8 = ("\u0130".encode("utf-8"), "\u212a".encode("utf-8"))
+
+
+def _raw_keywords(keywords: List[str]) -> List[bytes]:
+    """可以直接在 JSONL 原始字节中查找的关键词 (UTF-8 编码)
+
+    搜索比较的是 content.lower() 等字段; 对没有大小写之分的关键词
+    (中文、数字等), 小写后的文本包含它当且仅当原文包含它。唯一的例外是
+    "İ".lower() 会产生 U+0307, 含该字符的关键词排除在外。
+    写出 JSONL 时非 ASCII 字符不转义, 只有引号、反斜杠和控制字符会被转义,
+    含这些字符的关键词同样排除。
+    """
+    raw = []
+    for kw in keywords:
+        if kw.upper() != kw or "\u0307" in kw or '"' in kw or "\\" in kw:
+            continue
+        if any(ch < " " for ch in kw):
+            continue
+        raw.append(kw.encode("utf-8"))
+    return raw
+
+
+def _ascii_keywords(keywords: List[str]) -> List[bytes]:
+    """有大小写之分的纯 ASCII 关键词, 可在 bytes.lower() 后的原始行中查找
+
+    对 ASCII 字符 bytes.lower() 与 str.lower() 一致; 引号、反斜杠和控制字符
+    在 JSONL 中会被转义, 含这些字符的关键词排除在外 (同 _raw_keywords)。
+    """
+    return [
+        kw.encode("ascii") for kw in keywords
+        if kw.isascii() and kw.upper() != kw
+        and '"' not in kw and "\\" not in kw and all(ch >= " " for ch in kw)
+    ]
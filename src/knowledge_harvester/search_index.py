@@ -0,0 +1,131 @@
+"""搜索索引 - 每个平台一个 SQLite FTS5 (trigram) 倒排索引
+
+搜索语义是子串匹配 (关键词出现在小写后的消息内容/媒体文件名/描述中),
+中文没有分词边界, 所以按字符三元组 (trigram) 建索引, 而不是按词。
+索引只用来缩小候选对话范围: 命中的对话仍由 SearchEngine 逐行精确匹配和
+计分。JSONL 文件的 mtime/size 与建索引时不同 (或从未建索引) 的对话一律
+视为候选, 因此索引过期或缺失只影响速度, 不影响结果。
+
+运行时的 SQLite 不支持 FTS5 trigram (需要 3.34+) 时不建索引, 搜索退回全量扫描。
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# trigram 分词器只能匹配至少 3 个字符的词
+_TRIGRAM_MIN_CHARS = 3
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS files ("
+    "conv_id TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)",
+    # 文本已在 Python 中转为小写 (与搜索时的 str.lower() 一致), 按原样区分大小写
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+    "conv_id UNINDEXED, text, tokenize='trigram case_sensitive 1')",
+)
+
+
+def searchable_text(data: dict) -> str:
+    """一条消息 (JSONL 中的 dict) 参与搜索的文本: 内容 + 媒体文件名和描述, 小写"""
+    media_text = ""
+    for m in data.get("media", ()):
+        fn = m.get("filename", "")
+        desc = m.get("description", "")
+        if fn:
+            media_text += " " + fn
+        if desc:
+            media_text += " " + desc
+    return data.get("content", "").lower() + media_text.lower()
+
+
+def _file_stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class SearchIndex:
+    """单个平台的搜索索引 (platform_dir/search_index.db)"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    @classmethod
+    def open(cls, path: Path, create: bool = False) -> Optional["SearchIndex"]:
+        """打开索引; 文件不存在且 create=False, 或 SQLite 不支持 FTS5 trigram 时返回 None"""
+        if not create and not path.exists():
+            return None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), check_same_thread=False)
+        except (OSError, sqlite3.Error):
+            return None
+        try:
+            # 索引可随时由 JSONL 重建, 不需要崩溃安全的同步写
+            conn.execute("PRAGMA synchronous=OFF")
+            for sql in _SCHEMA:
+                conn.execute(sql)
+        except sqlite3.Error:
+            conn.close()
+            return None
+        return cls(conn)
+
+    def close(self):
+        self._conn.close()
+
+    def update(self, conv_id: str, messages: Iterable[dict], path: Path):
+        """用刚写出的 JSONL (path) 的消息替换该对话的索引"""
+        stat = _file_stat(path)
+        if stat is None:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+            self._conn.executemany(
+                "INSERT INTO messages (conv_id, text) VALUES (?, ?)",
+                ((conv_id, searchable_text(m)) for m in messages),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (conv_id, mtime_ns, size) VALUES (?, ?, ?)",
+                (conv_id, *stat),
+            )
+
+    def candidates(self, keywords: List[str], conv_paths: Dict[str, Path]) -> Set[str]:
+        """可能包含全部关键词的对话 ID (conv_paths: conv_id → JSONL 路径)
+
+        有某条消息同时包含全部关键词、或索引与文件不一致的对话都会返回;
+        文件已不存在的对话不返回。
+        """
+        indexed = {
+            conv_id: (mtime_ns, size)
+            for conv_id, mtime_ns, size in self._conn.execute(
+                "SELECT conv_id, mtime_ns, size FROM files")
+        }
+        stale = set()
+        for conv_id, path in conv_paths.items():
+            stat = _file_stat(path)
+            if stat is not None and indexed.get(conv_id) != stat:
+                stale.add(conv_id)
+
+        clauses = []
+        params = []
+        long_keywords = [kw for kw in keywords if len(kw) >= _TRIGRAM_MIN_CHARS]
+        if long_keywords:
+            # 每个关键词作为一个短语 (引号内的 " 需写成 "")
+            clauses.append("messages MATCH ?")
+            params.append(" AND ".join(
+                '"' + kw.replace('"', '""') + '"' for kw in long_keywords))
+        for kw in keywords:
+            if len(kw) < _TRIGRAM_MIN_CHARS:
+                clauses.append("instr(text, ?) > 0")
+                params.append(kw)
+
+        matched = {
+            conv_id for (conv_id,) in self._conn.execute(
+                "SELECT DISTINCT conv_id FROM messages WHERE " + " AND ".join(clauses),
+                params,
+            )
+        }
+        return (matched & conv_paths.keys()) | stale
@@ -1,12 +1,27 @@
 """存储层 - JSONL 读写和索引管理"""
 
+import contextlib
 import json
+import os
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import IO, Dict, List, Optional, Set, Tuple
 
 from .config import Config
 from .models import Conversation, Message
+from .search_index import SearchIndex
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+# bytes/str 均可解析; orjson 的解码错误同样是 ValueError
+_loads = _orjson.loads if _orjson is not None else json.loads
+
+# 批量保存期间, 内存中的索引至少每隔多少秒写盘一次
+INDEX_FLUSH_SECONDS = 5.0
 
 
 class Storage:
@@ -14,34 +29,72 @@ class Storage:
 
     def __init__(self, config: Config = None):
         self.config = config or Config()
+        self._search_indexes: Dict[str, Optional[SearchIndex]] = {}
+        self._index_cache: Dict[str, Dict[str, dict]] = {}  # platform → {对话 ID: 索引条目}
+        self._dirty_indexes: Set[str] = set()  # 有未写盘修改的平台
+        self._batch_depth = 0
+        self._last_index_flush = 0.0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """批量保存对话: 期间 index.json 只在内存中更新, 定时及结束时写盘
+
+        不在 batch 中时, 每次 save_conversation 都立即写出索引。
+        """
+        if not self._batch_depth:
+            self._last_index_flush = time.monotonic()
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush_indexes()
 
     def save_conversation(self, conversation: Conversation) -> Path:
         """将对话保存为 JSONL 文件, 返回文件路径"""
         path = self.config.conversation_path(conversation.platform, conversation.id)
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(path, "w", encoding="utf-8") as f:
-            for msg in conversation.messages:
-                f.write(json.dumps(msg.to_dict(), ensure_ascii=False) + "\n")
+        # 逐条编码为字节行 (有 orjson 时在 C 中完成), 整个文件一次写入
+        records = [msg.to_dict() for msg in conversation.messages]
+        with open(path, "wb") as f:
+            f.write(b"".join(_dumps_line(record) for record in records))
 
         self._update_index(conversation)
+        search_index = self._search_index(conversation.platform)
+        if search_index is not None:
+            search_index.update(conversation.id, records, path)
         return path
 
+    def _search_index(self, platform: str) -> Optional[SearchIndex]:
+        """平台的搜索索引 (首次使用时打开/创建; 不支持 FTS5 时为 None)"""
+        if platform not in self._search_indexes:
+            self._search_indexes[platform] = SearchIndex.open(
+                self.config.search_index_path(platform), create=True)
+        return self._search_indexes[platform]
+
+    def close(self):
+        """关闭已打开的搜索索引连接 (之后再保存对话时会重新打开)"""
+        for search_index in self._search_indexes.values():
+            if search_index is not None:
+                search_index.close()
+        self._search_indexes.clear()
+
     def load_conversation(self, platform: str, conversation_id: str) -> Conversation:
         """从 JSONL 文件加载对话"""
         path = self.config.conversation_path(platform, conversation_id)
 
         messages = []
-        with open(path, "r", encoding="utf-8") as f:
+        with open(path, "rb") as f:
             for line in f:
                 line = line.strip()
                 if not line:
                     continue
-                messages.append(Message.from_dict(json.loads(line)))
+                messages.append(Message.from_dict(_loads(line)))
 
         # 从索引获取元数据
-        index = self._load_index(platform)
-        entry = next((e for e in index if e["id"] == conversation_id), {})
+        entry = self._load_index(platform).get(conversation_id, {})
 
         return Conversation(
             id=conversation_id,
@@ -53,36 +106,39 @@ class Storage:
         )
 
     def _update_index(self, conversation: Conversation):
-        """更新平台索引文件"""
-        index = self._load_index(conversation.platform)
-
-        # 替换或追加
-        entry = conversation.to_index_entry()
-        found = False
-        for i, existing in enumerate(index):
-            if existing["id"] == conversation.id:
-                index[i] = entry
-                found = True
-                break
-        if not found:
-            index.append(entry)
-
-        index_path = self.config.index_path(conversation.platform)
-        index_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(index_path, "w", encoding="utf-8") as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
-
-    def _load_index(self, platform: str) -> List[dict]:
-        """加载平台索引"""
-        index_path = self.config.index_path(platform)
-        if not index_path.exists():
-            return []
-        with open(index_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        """更新平台索引 (批量保存期间只更新内存, 见 batch)"""
+        platform = conversation.platform
+        # 替换或追加 (dict 保持插入顺序, 已有条目原位替换)
+        self._load_index(platform)[conversation.id] = conversation.to_index_entry()
+
+        self._dirty_indexes.add(platform)
+        if (not self._batch_depth
+                or time.monotonic() - self._last_index_flush >= INDEX_FLUSH_SECONDS):
+            self.flush_indexes()
+
+    def flush_indexes(self):
+        """把内存中修改过的索引写回 index.json (临时文件 + 替换, 不会留下半个文件)"""
+        for platform in sorted(self._dirty_indexes):
+            _write_atomic(self.config.index_path(platform),
+                          _dumps_indented(list(self._index_cache[platform].values())))
+        self._dirty_indexes.clear()
+        self._last_index_flush = time.monotonic()
+
+    def _load_index(self, platform: str) -> Dict[str, dict]:
+        """加载平台索引 {对话 ID: 条目} (首次读盘后缓存, 包含尚未写盘的修改)"""
+        index = self._index_cache.get(platform)
+        if index is None:
+            index_path = self.config.index_path(platform)
+            entries = []
+            if index_path.exists():
+                with open(index_path, "rb") as f:
+                    entries = _loads(f.read())
+            index = self._index_cache[platform] = {e["id"]: e for e in entries}
+        return index
 
     def list_conversations(self, platform: str) -> List[dict]:
         """列出某平台的所有对话 (从索引)"""
-        return self._load_index(platform)
+        return list(self._load_index(platform).values())
 
     def list_platforms(self) -> List[str]:
         """列出所有已导入的平台"""
@@ -110,18 +166,55 @@ class Storage:
         }
         """
         path = self.config.state_path(platform)
-        if not path.exists():
-            return {"last_run": "", "conversations": {}}
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        if path.exists():
+            with open(path, "rb") as f:
+                state = _loads(f.read())
+        else:
+            state = {"last_run": "", "conversations": {}}
+        # 上次提取中断时, 追加日志里还有未合并的进度
+        self._replay_state_journal(platform, state)
+        return state
 
     def save_state(self, platform: str, state: Dict):
-        """保存平台提取状态"""
-        path = self.config.state_path(platform)
-        path.parent.mkdir(parents=True, exist_ok=True)
+        """保存平台提取状态
+
+        先写临时文件再替换 state.json, 成功后删除追加日志 (日志已合并进状态)。
+        """
         state["last_run"] = datetime.now(timezone.utc).isoformat()
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        _write_atomic(self.config.state_path(platform), _dumps_indented(state))
+        journal_path = self._state_journal_path(platform)
+        if journal_path.exists():
+            journal_path.unlink()
+
+    def _state_journal_path(self, platform: str) -> Path:
+        """状态追加日志 state.jsonl, 与 state.json 同目录"""
+        return self.config.state_path(platform).with_suffix(".jsonl")
+
+    def open_state_journal(self, platform: str) -> IO[bytes]:
+        """以追加模式打开状态日志, 提取过程中每段对话写一行
+
+        提取结束时由 save_state 合并为 state.json; 中途中断则下次
+        load_state 时回放, 已导入的对话不会重复处理。
+        """
+        path = self._state_journal_path(platform)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return open(path, "ab")
+
+    def _replay_state_journal(self, platform: str, state: Dict):
+        """把追加日志中的条目合并进状态 (同一 ID 以最后一行为准)"""
+        path = self._state_journal_path(platform)
+        if not path.exists():
+            return
+        conversations = state.setdefault("conversations", {})
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    continue  # 中断时写了一半的行
+                conv_id = entry.pop("id", None)
+                if conv_id is not None:
+                    conversations[conv_id] = entry
 
     def get_known_ids(self, platform: str) -> Set[str]:
         """获取已导入的对话 ID 集合"""
@@ -129,26 +222,66 @@ class Storage:
         return set(state.get("conversations", {}).keys())
 
     def is_conversation_changed(self, platform: str, conversation: "Conversation") -> bool:
-        """判断对话是否有变化 (新消息或新对话)"""
-        state = self.load_state(platform)
-        existing = state.get("conversations", {}).get(conversation.id)
-        if existing is None:
-            return True  # 新对话
-        # 消息数量变化或最后消息时间变化
+        """判断对话是否有变化 (新消息或新对话)
+
+        每次调用都会重新读取状态文件; 批量判断时先用 state_signatures
+        建好索引, 再与 conversation_signature 比较。
+        """
+        signatures = self.state_signatures(self.load_state(platform))
+        return signatures.get(conversation.id) != self.conversation_signature(conversation)
+
+    @staticmethod
+    def conversation_signature(conversation: "Conversation") -> Tuple[int, str]:
+        """对话的变化签名: (消息数量, 最后消息时间)"""
         last_ts = ""
         if conversation.messages:
             last_ts = conversation.messages[-1].timestamp
-        return (
-            conversation.message_count != existing.get("message_count", 0)
-            or last_ts != existing.get("last_message_time", "")
-        )
+        return conversation.message_count, last_ts
 
-    def update_state_for_conversation(self, state: Dict, conversation: "Conversation"):
-        """更新状态中单个对话的信息"""
+    @staticmethod
+    def state_signatures(state: Dict) -> Dict[str, Tuple[int, str]]:
+        """状态中每段对话的变化签名: conv_id → (消息数量, 最后消息时间)"""
+        return {
+            conv_id: (entry.get("message_count", 0), entry.get("last_message_time", ""))
+            for conv_id, entry in state.get("conversations", {}).items()
+        }
+
+    def update_state_for_conversation(self, state: Dict, conversation: "Conversation",
+                                      journal: Optional[IO[bytes]] = None):
+        """更新状态中单个对话的信息
+
+        传入 journal (open_state_journal 的返回值) 时同时追加一行日志。
+        """
         last_ts = ""
         if conversation.messages:
             last_ts = conversation.messages[-1].timestamp
-        state.setdefault("conversations", {})[conversation.id] = {
+        entry = {
             "message_count": conversation.message_count,
             "last_message_time": last_ts,
         }
+        state.setdefault("conversations", {})[conversation.id] = entry
+        if journal is not None:
+            journal.write(_dumps_line({"id": conversation.id, **entry}))
+
+
+def _write_atomic(path: Path, data: bytes):
+    """先写同目录的临时文件再替换目标, 读者只会看到完整的旧文件或新文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _dumps_indented(data) -> bytes:
+    """缩进 2 格的 JSON (UTF-8 字节), 优先 orjson"""
+    if _orjson is not None:
+        return _orjson.dumps(data, option=_orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _dumps_line(data) -> bytes:
+    """紧凑的单行 JSON (UTF-8 字节, 含换行), 优先 orjson"""
+    if _orjson is not None:
+        return _orjson.dumps(data, option=_orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
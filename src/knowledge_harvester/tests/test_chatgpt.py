@@ -4,6 +4,8 @@ import json
 import zipfile
 from pathlib import Path
 
+import pytest
+
 from knowledge_harvester.adapters.chatgpt import ChatGPTAdapter, _timestamp_to_iso
 
 FIXTURES_DIR = Path(__file__).parent / "fixtures"
@@ -15,6 +17,14 @@ def test_timestamp_to_iso():
     assert _timestamp_to_iso("invalid") == ""
 
 
+def test_timestamp_to_iso_matches_datetime():
+    """按整秒缓存后, 小数部分 (含进位和负数) 与 datetime.isoformat() 一致"""
+    from datetime import datetime, timezone
+    for ts in (1700000000.123456, 1700000000.5, 1700000000.9999996, -1.5, 1700000001):
+        expected = datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+        assert _timestamp_to_iso(ts) == expected
+
+
 def test_extract_from_json():
     adapter = ChatGPTAdapter()
     conversations = list(adapter.extract(str(FIXTURES_DIR / "chatgpt_export.json")))
@@ -83,6 +93,29 @@ def test_extract_from_zip(tmp_path):
     assert conversations[0].title == "Python 装饰器教程"
 
 
+def test_extract_from_zip_subdirectory(tmp_path):
+    adapter = ChatGPTAdapter()
+
+    # conversations.json 位于子目录, 且 ZIP 中有其他附件
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("export/file-abc123.png", b"fake image")
+        zf.write(FIXTURES_DIR / "chatgpt_export.json", "export/conversations.json")
+
+    conversations = list(adapter.extract(str(zip_path)))
+    assert len(conversations) == 3
+
+
+def test_extract_zip_without_conversations(tmp_path):
+    adapter = ChatGPTAdapter()
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("chat.html", "<html></html>")
+
+    with pytest.raises(FileNotFoundError):
+        list(adapter.extract(str(zip_path)))
+
+
 def test_extract_empty_conversations():
     adapter = ChatGPTAdapter()
 
@@ -98,6 +131,57 @@ def test_extract_empty_conversations():
         json_path.unlink(missing_ok=True)
 
 
+def test_extract_rejects_non_array(tmp_path):
+    adapter = ChatGPTAdapter()
+    json_path = tmp_path / "conversations.json"
+    json_path.write_text(json.dumps({"id": "not-a-list"}), encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(adapter.extract(str(json_path)))
+
+
+def test_extract_rejects_non_array_streaming(tmp_path, monkeypatch):
+    """大文件走 ijson 流式解析时同样拒绝非数组"""
+    from knowledge_harvester.adapters import chatgpt
+    if chatgpt._ijson is None:
+        pytest.skip("未安装 ijson")
+    monkeypatch.setattr(chatgpt, "STREAM_THRESHOLD_BYTES", 0)
+    json_path = tmp_path / "conversations.json"
+    json_path.write_text(json.dumps({"id": "not-a-list"}), encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(ChatGPTAdapter().extract(str(json_path)))
+
+
+def test_extract_follows_current_node_branch():
+    adapter = ChatGPTAdapter()
+
+    def _node(node_id, parent, children, role, text):
+        return {
+            "id": node_id, "parent": parent, "children": children,
+            "message": {
+                "id": node_id, "author": {"role": role},
+                "content": {"content_type": "text", "parts": [text]},
+                "status": "finished_successfully",
+            },
+        }
+
+    mapping = {
+        "root": {"id": "root", "parent": None, "children": ["u1"], "message": None},
+        "u1": _node("u1", "root", ["a1-old", "a1-new"], "user", "问题"),
+        "a1-old": _node("a1-old", "u1", [], "assistant", "旧回答"),
+        "a1-new": _node("a1-new", "u1", [], "assistant", "重新生成的回答"),
+    }
+
+    # 有 current_node 时沿当前分支回溯
+    messages = adapter._extract_messages(mapping, "a1-new")
+    assert [m.content for m in messages] == ["问题", "重新生成的回答"]
+
+    # 没有 current_node 时沿第一个 child 遍历
+    messages = adapter._extract_messages(mapping)
+    assert [m.content for m in messages] == ["问题", "旧回答"]
+
+
 def test_participants():
     adapter = ChatGPTAdapter()
     conversations = list(adapter.extract(str(FIXTURES_DIR / "chatgpt_export.json")))
@@ -1,5 +1,9 @@
 """数据模型测试"""
 
+import sys
+
+import pytest
+
 from knowledge_harvester.models import Conversation, MediaRef, Message
 
 
@@ -160,3 +164,35 @@ def test_media_ref_roundtrip_new_fields():
     assert m.size_bytes == 2400000
     assert m.description == "AI战略规划文档"
     assert m.summary == ""  # 未设置
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots 需要 3.10+")
+def test_media_ref_from_dict_ignores_unknown_keys():
+    d = {"role": "user", "content": "x",
+         "media": [{"type": "image", "path": "/a.jpg", "width": 640}]}
+    msg = Message.from_dict(d)
+    assert msg.media == [MediaRef(type="image", path="/a.jpg")]
+
+
+def test_from_dict_interns_enum_strings():
+    """反序列化得到的 role / content_type / 媒体 type 共享同一字符串对象"""
+    def load():
+        # 每次都重新构造字符串, 模拟 JSON 解码出的新对象
+        return Message.from_dict({
+            "role": "".join(["assis", "tant"]), "content": "x",
+            "content_type": "".join(["mix", "ed"]),
+            "media": [{"type": "".join(["ima", "ge"])}],
+        })
+
+    a, b = load(), load()
+    assert a.role is b.role
+    assert a.content_type is b.content_type
+    assert a.media[0].type is b.media[0].type
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots 需要 3.10+")
+def test_models_use_slots():
+    """热路径上大量创建的模型不带 __dict__"""
+    for obj in (MediaRef(type="image"), Message(role="user", content="x"),
+                Conversation(id="c", platform="wechat", title="t")):
+        assert not hasattr(obj, "__dict__")
@@ -3,6 +3,8 @@
 import json
 from pathlib import Path
 
+import pytest
+
 from knowledge_harvester.config import Config
 from knowledge_harvester.models import Conversation, Message
 from knowledge_harvester.search import SearchEngine
@@ -141,3 +143,89 @@ def test_search_limit(tmp_path):
 
     results = engine.search("Python", max_results=1)
     assert len(results) <= 1
+
+
+def test_search_ascii_escaped_jsonl(tmp_path):
+    """其它工具以 \\u 转义写出的 JSONL 也能搜到中文关键词"""
+    config = _setup_test_data(tmp_path)
+    path = config.conversation_path("chatgpt", "conv-1")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "user", "content": "转义的装饰器问题"}) + "\n")
+    engine = SearchEngine(config)
+
+    results = engine.search("转义的装饰器")
+    assert [r.message.content for r in results] == ["转义的装饰器问题"]
+
+
+def test_search_ascii_keyword_case_insensitive(tmp_path):
+    """ASCII 关键词按字节预筛后仍与 str.lower() 的结果一致"""
+    config = _setup_test_data(tmp_path)
+    path = config.conversation_path("chatgpt", "conv-1")
+    with open(path, "a", encoding="utf-8") as f:
+        for content in ("KELVIN 温度", "\u212aelvin 符号", "kelv in"):
+            f.write(json.dumps({"role": "user", "content": content}, ensure_ascii=False) + "\n")
+    engine = SearchEngine(config)
+
+    results = engine.search("Kelvin")
+    assert sorted(r.message.content for r in results) == ["KELVIN 温度", "\u212aelvin 符号"]
+
+
+def test_search_conversation_hit_lines(tmp_path):
+    """只解析含命中位置的行: 同一行多次命中只算一条, 末行无换行也能命中"""
+    config = _setup_test_data(tmp_path)
+    path = config.conversation_path("chatgpt", "conv-1")
+    with open(path, "ab") as f:
+        f.write('{"role": "user", "content": "回声 回声"}\n'.encode("utf-8"))
+        f.write('{"role": "user", "content": "最后的回声"}'.encode("utf-8"))
+    engine = SearchEngine(config)
+
+    hits = engine._search_conversation("chatgpt", "conv-1", "", ["回声"])
+    assert [r.message.content for r in hits] == ["回声 回声", "最后的回声"]
+    assert engine._search_conversation("chatgpt", "conv-1", "", ["回声", "没有"]) == []
+
+
+def test_search_index_narrows_candidates(tmp_path):
+    config = _setup_test_data(tmp_path)
+    engine = SearchEngine(config)
+    if not config.search_index_path("chatgpt").exists():
+        pytest.skip("SQLite 不支持 FTS5 trigram")
+
+    index = engine._load_index("chatgpt")
+    assert engine._candidates("chatgpt", ["装饰器"], index) == {"conv-1"}
+    assert engine._candidates("chatgpt", ["usestate", "hook"], index) == {"conv-2"}
+    assert engine._candidates("chatgpt", ["不存在"], index) == set()
+
+
+def test_search_index_stale_file_still_searched(tmp_path):
+    """JSONL 在建索引后被修改时, 该对话照常逐行扫描"""
+    config = _setup_test_data(tmp_path)
+    path = config.conversation_path("chatgpt", "conv-2")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "user", "content": "新增的关键词"}, ensure_ascii=False) + "\n")
+    engine = SearchEngine(config)
+
+    results = engine.search("新增的关键词")
+    assert [r.conversation_id for r in results] == ["conv-2"]
+
+
+def test_search_by_role_filters_during_scan(tmp_path):
+    config = _setup_test_data(tmp_path)
+    engine = SearchEngine(config)
+
+    # 每段对话中 user 和 assistant 都提到 Python; max_results 按筛选后计数
+    results = engine.search_by_role("Python", "assistant", max_results=1)
+    assert len(results) == 1
+    assert results[0].message.role == "assistant"
+
+
+def test_load_index_cached_until_file_changes(tmp_path):
+    config = _setup_test_data(tmp_path)
+    engine = SearchEngine(config)
+
+    first = engine._load_index("chatgpt")
+    assert engine._load_index("chatgpt") is first
+
+    Storage(config).save_conversation(Conversation(
+        id="conv-new", platform="chatgpt", title="新对话",
+        messages=[Message(role="user", content="hi")]))
+    assert len(engine._load_index("chatgpt")) == len(first) + 1
@@ -96,6 +96,31 @@ def test_index_update_replaces_existing(tmp_path):
     assert index[0]["message_count"] == 3
 
 
+def test_batch_defers_index_write(tmp_path):
+    storage = _make_storage(tmp_path)
+    index_path = tmp_path / "conversations" / "chatgpt" / "index.json"
+
+    with storage.batch():
+        storage.save_conversation(_sample_conversation())
+        # 批量期间内存中的索引已更新, 文件在结束时才写出
+        assert len(storage.list_conversations("chatgpt")) == 1
+        assert not index_path.exists()
+
+    with open(index_path, encoding="utf-8") as f:
+        assert [e["id"] for e in json.load(f)] == ["test-conv-1"]
+
+
+def test_close_releases_search_indexes(tmp_path):
+    storage = _make_storage(tmp_path)
+    storage.save_conversation(_sample_conversation())
+    storage.close()
+    assert storage._search_indexes == {}
+
+    # 关闭后仍可继续保存 (重新打开索引)
+    storage.save_conversation(_sample_conversation())
+    storage.close()
+
+
 def test_multiple_conversations(tmp_path):
     storage = _make_storage(tmp_path)
 
@@ -210,3 +235,22 @@ def test_get_known_ids(tmp_path):
 
     known = storage.get_known_ids("chatgpt")
     assert known == {"test-conv-1", "conv-2"}
+
+
+def test_state_journal_replayed_after_interrupt(tmp_path):
+    storage = _make_storage(tmp_path)
+    state = storage.load_state("chatgpt")
+
+    # 写完日志但未调用 save_state (模拟提取中断)
+    journal = storage.open_state_journal("chatgpt")
+    storage.update_state_for_conversation(state, _sample_conversation(), journal)
+    journal.write(b'{"id": "half')
+    journal.close()
+
+    loaded = storage.load_state("chatgpt")
+    assert loaded["conversations"]["test-conv-1"]["message_count"] == 2
+
+    # save_state 合并后删除日志
+    storage.save_state("chatgpt", loaded)
+    assert not (tmp_path / "conversations" / "chatgpt" / "state.jsonl").exists()
+    assert storage.get_known_ids("chatgpt") == {"test-conv-1"}
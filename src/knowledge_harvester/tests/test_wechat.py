@@ -6,6 +6,8 @@
 import sqlite3
 from pathlib import Path
 
+import pytest
+
 from knowledge_harvester.adapters.wechat import (
     WeChatAdapter, _sanitize_id, _parse_type49_xml, _format_size,
 )
@@ -159,6 +161,13 @@ def test_sanitize_id():
     assert _sanitize_id("用户123") == "用户123"  # Unicode 字母保留
 
 
+def test_sanitize_id_matches_isalnum_rule():
+    """正则实现与逐字符 isalnum() 规则在整个 BMP 上一致"""
+    chars = "".join(chr(i) for i in range(0x10000) if not 0xD800 <= i < 0xE000)
+    expected = "".join(c if (c.isalnum() or c in "-_") else "_" for c in chars)
+    assert _sanitize_id(chars) == expected
+
+
 def test_encrypted_db_without_key(tmp_path):
     """加密数据库无密钥应该给出提示"""
     # 创建一个看起来像加密数据库的文件 (非有效 SQLite)
@@ -263,6 +272,51 @@ def test_parse_type49_reference():
     assert media == []
 
 
+def test_parse_type49_reference_nested_fields():
+    """引用块中的 type/title 在 appmsg 自身字段之前时, 仍取 appmsg 的直接子元素"""
+    xml = """<msg>
+        <appmsg appid="" sdkver="0">
+            <title>回复内容</title>
+            <refermsg>
+                <type>5</type>
+                <title>被引用的文章</title>
+                <content>原文摘要</content>
+            </refermsg>
+            <type>57</type>
+        </appmsg>
+    </msg>"""
+    label, media = _parse_type49_xml(xml)
+    assert label == "回复内容\n[引用: 原文摘要]"
+    assert media == []
+
+
+def test_parse_type49_tag_attributes():
+    """正则快速路径: 开始标签带属性的字段也能取到"""
+    xml = """<msg><appmsg><title lang="zh">带属性的标题</title><des/>
+        <type>5</type><url>https://example.com</url></appmsg></msg>"""
+    label, media = _parse_type49_xml(xml)
+    assert label == "[链接: 带属性的标题]"
+    assert media[0].description == ""
+
+
+def test_parse_type49_self_closing_field_with_nested_block():
+    """自闭合的 <url/> 后跟内嵌块中的 url 时, 与 XML 解析结果一致 (不取内嵌值)"""
+    xml = """<msg><appmsg><title>公众号文章</title><url/><type>5</type>
+        <mmreader><category><item><url>https://nested.example</url></item></category></mmreader>
+        </appmsg></msg>"""
+    label, media = _parse_type49_xml(xml)
+    assert label == "[链接: 公众号文章]"
+    assert media[0].original_url == ""
+
+
+def test_parse_type49_html_entity_uses_xml_path():
+    """XML 不接受的实体 (&nbsp;) 不在快速路径中反转义, 交给 XML 解析判定"""
+    xml = "<msg><appmsg><title>A&nbsp;B</title><type>5</type></appmsg></msg>"
+    label, media = _parse_type49_xml(xml)
+    # XML 解析失败后由正则兜底, 与改动前的 XML 路径一致
+    assert label == "[链接: A&nbsp;B]"
+
+
 def test_parse_type49_chat_history():
     """解析聊天记录合并转发 (sub_type=19)"""
     xml = """<msg>
@@ -275,6 +329,20 @@ def test_parse_type49_chat_history():
     assert label == "[聊天记录: 群聊的聊天记录]"
 
 
+def test_parse_type49_large_chat_history_streaming():
+    """超大 XML 走 iterparse, 只取 appmsg 直接字段, 忽略内嵌记录中的同名标签"""
+    records = "".join(
+        f"<recorditem><title>内嵌 {i}</title><des>{'x' * 100}</des></recorditem>"
+        for i in range(1000)
+    )
+    xml = (f"<msg><appmsg><title>群聊的聊天记录</title><type>19</type>"
+           f"<recorditems>{records}</recorditems></appmsg></msg>")
+    assert len(xml) > 64 * 1024
+    label, media = _parse_type49_xml(xml)
+    assert label == "[聊天记录: 群聊的聊天记录]"
+    assert media == []
+
+
 def test_parse_type49_transfer():
     """解析转账/红包 (sub_type=2000/2001)"""
     xml_transfer = '<msg><appmsg><title>转账</title><type>2000</type></appmsg></msg>'
@@ -330,6 +398,22 @@ def test_parse_type49_regex_fallback():
     assert "测试标题" in label
 
 
+def test_parse_type49_cdata_and_entities():
+    """正则快速路径: CDATA 原样保留, 普通文本反转义实体"""
+    xml = """<msg>
+        <appmsg>
+            <title><![CDATA[A & B]]></title>
+            <des>x &amp; y</des>
+            <type>5</type>
+            <url>https://example.com/?a=1&amp;b=2</url>
+        </appmsg>
+    </msg>"""
+    label, media = _parse_type49_xml(xml)
+    assert label == "[链接: A & B]"
+    assert media[0].original_url == "https://example.com/?a=1&b=2"
+    assert media[0].description == "x & y"
+
+
 def test_format_size():
     """文件大小格式化"""
     assert _format_size(0) == ""
@@ -416,3 +500,164 @@ def test_media_types_create_media_ref(tmp_path):
     assert msgs[0].media[0].type == "image"
     assert msgs[1].media[0].type == "voice"
     assert msgs[2].media[0].type == "video"
+
+
+def test_derive_raw_key_uses_disk_cache(tmp_path, monkeypatch):
+    """raw key 派生结果写入磁盘缓存 (0600), 再次派生直接命中缓存"""
+    from knowledge_harvester.adapters import wechat
+
+    cache_path = tmp_path / "cache" / "wechat_keys.json"
+    monkeypatch.setattr(wechat, "KEY_CACHE_PATH", cache_path)
+    monkeypatch.setattr(wechat, "_key_cache", None)
+    monkeypatch.setenv(wechat.KEY_CACHE_ENV, "1")
+    # 残留的宽权限临时文件不影响最终权限
+    cache_path.parent.mkdir()
+    stale_tmp = cache_path.with_name(cache_path.name + ".tmp")
+    stale_tmp.write_text("{}")
+    stale_tmp.chmod(0o644)
+
+    db_path = tmp_path / "message_0.db"
+    db_path.write_bytes(bytes(range(16)) + b"\0" * 16)
+    master = "ab" * 32
+
+    raw_key = wechat._derive_raw_key(master, db_path)
+    assert len(raw_key) == 64
+    assert cache_path.stat().st_mode & 0o777 == 0o600
+
+    # 新进程 (清空内存缓存) 读取磁盘缓存, 不再调用 PBKDF2
+    monkeypatch.setattr(wechat, "_key_cache", None)
+    monkeypatch.setattr(wechat.hashlib, "pbkdf2_hmac", None)
+    assert wechat._derive_raw_key(master, db_path) == raw_key
+
+
+def test_derive_raw_key_no_disk_cache_by_default(tmp_path, monkeypatch):
+    """未显式启用时 raw key 不写入磁盘"""
+    from knowledge_harvester.adapters import wechat
+
+    cache_path = tmp_path / "cache" / "wechat_keys.json"
+    monkeypatch.setattr(wechat, "KEY_CACHE_PATH", cache_path)
+    monkeypatch.setattr(wechat, "_key_cache", None)
+    monkeypatch.delenv(wechat.KEY_CACHE_ENV, raising=False)
+
+    db_path = tmp_path / "message_0.db"
+    db_path.write_bytes(bytes(range(16)) + b"\0" * 16)
+    wechat._derive_raw_keys("ab" * 32, [db_path])
+    assert not cache_path.parent.exists()
+
+
+def test_unix_to_iso_outside_fast_range():
+    """快速路径范围外的时间戳 (负数、2038 年以后) 仍按 datetime 格式化"""
+    from datetime import datetime, timezone
+    from knowledge_harvester.adapters.wechat import _unix_to_iso
+
+    for ts in (1700000000, -86400, 2 ** 31, 4102444800, 1700000000.5):
+        assert _unix_to_iso(ts) == datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+    assert _unix_to_iso(0) == ""
+    assert _unix_to_iso(10 ** 20) == ""
+
+
+def test_decompress_content_without_frame_size():
+    """帧头未记录原始大小的 zstd 内容也能解压; 非 zstd 数据返回 None"""
+    zstandard = pytest.importorskip("zstandard")
+    from knowledge_harvester.adapters.wechat import _decompress_content
+
+    cobj = zstandard.ZstdCompressor(write_content_size=False).compressobj()
+    raw = cobj.compress("压缩的消息".encode("utf-8")) + cobj.flush()
+    assert _decompress_content(raw) == "压缩的消息"
+    assert _decompress_content(b"plain text") is None
+
+
+def test_iter_decompressed_rows_parallel(monkeypatch):
+    """线程池批量解压后, 压缩行替换为文本且压缩标记置 0, 行序不变"""
+    zstandard = pytest.importorskip("zstandard")
+    from knowledge_harvester.adapters import wechat
+
+    monkeypatch.setattr(wechat, "PARALLEL_DECOMPRESS_MIN", 1)
+    monkeypatch.setattr(wechat, "DECOMPRESS_BATCH_ROWS", 2)
+    cctx = zstandard.ZstdCompressor()
+    rows = [
+        (1, 0, 1, 0, 100, 2, cctx.compress("第一条".encode("utf-8")), 4),
+        (2, 0, 1, 0, 101, 2, "未压缩", 0),
+        (3, 0, 1, 0, 102, 3, cctx.compress("第三条".encode("utf-8")), 4),
+    ]
+    out = list(wechat._iter_decompressed_rows(iter(rows)))
+    assert [r[0] for r in out] == [1, 2, 3]
+    assert out[0][6:] == ("第一条", 0)
+    assert out[1] == rows[1]
+    assert out[2][6:] == ("第三条", 0)
+
+
+def test_parse_type49_cached_media_refs_not_shared():
+    """同一 XML 命中缓存时, 每次返回独立的 MediaRef (调用方会修改 path)"""
+    xml = ("<msg><appmsg><title>文章</title><type>5</type>"
+           "<url>https://example.com/a</url></appmsg></msg>")
+    _, first = _parse_type49_xml(xml)
+    first[0].path = "/tmp/changed"
+    _, second = _parse_type49_xml(xml)
+    assert second[0].path == ""
+    assert second[0].original_url == "https://example.com/a"
+
+
+def test_parse_type49_malformed_xml_title_fallback():
+    """XML 无法解析时用正则取 title, CDATA 中的标题也能取出"""
+    label, media = _parse_type49_xml(
+        "<msg><appmsg><title><![CDATA[坏掉的 <b>]]></title>"
+        "<type>57</type></appmsg>")
+    assert label == "[链接: 坏掉的 <b>]"
+    assert media[0].filename == "坏掉的 <b>"
+
+
+def test_iter_cli_rows_json_and_pipe_fallback():
+    """CLI 输出: 跳过 PRAGMA 的 ok 行解析 JSON; 非 JSON 时按 | 分隔"""
+    from knowledge_harvester.adapters.wechat import _iter_cli_rows
+
+    output = b'ok\n[{"a":1,"b":"x"},\n{"a":2,"b":"\xe4\xbd\xa0"}]\n'
+    assert list(_iter_cli_rows(output)) == [[1, "x"], [2, "你"]]
+    assert list(_iter_cli_rows(b"ok\n1|foo\n2|bar\n")) == [["1", "foo"], ["2", "bar"]]
+    assert list(_iter_cli_rows(b"")) == []
+
+
+def test_lookup_contact_hashes_lazily():
+    """联系人 MD5 按需计算: 命中即停, 之后的行保持未处理"""
+    import hashlib
+
+    adapter = WeChatAdapter()
+    adapter._pending_contacts = iter([
+        ("wxid_a", "A", ""), ("wxid_b", "B", "备注B"), ("wxid_c", "C", ""),
+    ])
+    key_b = hashlib.md5(b"wxid_b").hexdigest()
+    assert adapter._lookup_contact(key_b)["display"] == "备注B"
+    assert len(adapter._contact_map) == 2  # wxid_c 尚未计算
+    assert adapter._lookup_contact("0" * 32) == {}
+    assert len(adapter._contact_map) == 3
+
+
+def test_resolve_media_paths_uses_directory_listing(tmp_path):
+    """文件按 msg/file/YYYY-MM 匹配, 图片按 local_id 找缓存缩略图"""
+    from knowledge_harvester.models import MediaRef, Message
+
+    (tmp_path / "msg/file/2026-01").mkdir(parents=True)
+    (tmp_path / "msg/file/2026-01/报告.pdf").write_bytes(b"x")
+    thumb_dir = tmp_path / "cache/2026-01/Message/abc/Thumb"
+    thumb_dir.mkdir(parents=True)
+    (thumb_dir / "12_1700000000_thumb.jpg").write_bytes(b"x")
+    (thumb_dir / "123_1700000001_thumb.jpg").write_bytes(b"x")
+
+    adapter = WeChatAdapter()
+    adapter._wechat_user_root = tmp_path
+    ts = "2026-01-05T00:00:00+00:00"
+    messages = [
+        Message(role="user", content="", timestamp=ts, message_id="1",
+                media=[MediaRef(type="file", filename="报告.pdf")]),
+        Message(role="user", content="", timestamp=ts, message_id="2",
+                media=[MediaRef(type="file", filename="不存在.pdf")]),
+        Message(role="user", content="", timestamp=ts, message_id="12",
+                media=[MediaRef(type="image")]),
+        Message(role="user", content="", timestamp=ts, message_id="99",
+                media=[MediaRef(type="image")]),
+    ]
+    adapter._resolve_media_paths(messages, "abc")
+    assert messages[0].media[0].path == str(tmp_path / "msg/file/2026-01/报告.pdf")
+    assert messages[1].media[0].path == ""
+    assert messages[2].media[0].path == str(thumb_dir / "12_1700000000_thumb.jpg")
+    assert messages[3].media[0].path == ""
@@ -241,7 +241,7 @@ def cmd_add_rule(config: Config, policy_path: str, name: str, match_json: str,
 
     match = json.loads(match_json)
     rule = FilterRule(name=name, match=match, tier=tier, priority=priority, reason=reason)
-    policy.rules.append(rule)
+    policy.add_rules([rule])
     policy.save(str(path))
 
     print(f"Added rule '{name}' (tier={tier}, priority={priority}) to {policy_path}")
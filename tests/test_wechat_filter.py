@@ -137,6 +137,22 @@ def test_match_active_within_days():
     assert _matches(rule, {}) is False
 
 
+def test_match_days_against_fixed_now():
+    # 2026-03-01T00:00:00Z
+    now = 1772323200
+    active = FilterRule(name="active", match={"active_within_days": 30}, tier="keep")
+    dormant = FilterRule(name="dormant", match={"dormant_days": 30}, tier="exclude")
+    recent = {"last_message_time": "2026-02-20T10:00:00Z"}
+    old = {"last_message_time": "2024-01-01T00:00:00+00:00"}
+    assert _matches(active, recent, now) is True
+    assert _matches(active, old, now) is False
+    assert _matches(dormant, recent, now) is False
+    assert _matches(dormant, old, now) is True
+    # Invalid timestamp: never active, always dormant
+    assert _matches(active, {"last_message_time": "not a date"}, now) is False
+    assert _matches(dormant, {"last_message_time": "not a date"}, now) is True
+
+
 def test_match_dormant_days():
     rule = FilterRule(name="dormant", match={"dormant_days": 365}, tier="exclude")
     # Old timestamp (dormant)
@@ -210,6 +226,22 @@ def test_evaluate_most_specific_wins():
     assert rule == "general"
 
 
+def test_evaluate_priority_tie_first_declared_wins():
+    """Equal priority: the rule declared first wins; added rules are honoured."""
+    policy = FilterPolicy(
+        default_tier="archive",
+        rules=[
+            FilterRule(name="first", match={}, tier="keep", priority=10),
+            FilterRule(name="second", match={}, tier="exclude", priority=10),
+        ],
+    )
+    assert policy.evaluate({}) == ("keep", "first")
+
+    policy.add_rules([FilterRule(name="top", match={}, tier="exclude", priority=50)])
+    assert policy.evaluate({}) == ("exclude", "top")
+    assert [r.name for r in policy.rules] == ["first", "second", "top"]
+
+
 # --- build_conversation_meta ---
 
 def test_build_conversation_meta():